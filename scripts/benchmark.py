@@ -0,0 +1,517 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Generate deterministic synthetic inputs and time the scripts on them
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ['gtf_index', 'gtf_features', 'gtf_isoforms_per_gene', 'gtf_filter',
+          'get_polya_tids', 'tns_gene_exp', 'tns_eval', 'check_splits']
+
+BASES = 'ACGT'
+
+class SyntheticData:
+    def __init__(self, outdir, seed):
+        self.outdir = outdir
+        self.rng = random.Random(seed)
+        self.chroms = list()       # (name, length)
+        self.transcripts = list()  # (tid, gid, chrom, strand, exons)
+        self.paths = dict()
+        self.counts = dict()
+
+    def path(self, name):
+        return os.path.join(self.outdir, name)
+
+    def write_gtf(self, num_genes, max_isoforms, max_exons):
+        rng = self.rng
+        genes_per_chrom = max(1, num_genes // 20)
+        chrom = None
+        pos = 0
+        num_lines = 0
+        with open(self.path('annotation.gtf'), 'wt') as fh:
+            fh.write('#!genome-build synthetic\n')
+            for g in range(num_genes):
+                if g % genes_per_chrom == 0:
+                    if chrom:
+                        self.chroms.append((chrom, pos))
+                    chrom = str(len(self.chroms) + 1)
+                    pos = 1000
+                gid = 'ENSG%011d' % (g + 1)
+                strand = rng.choice('+-')
+                gene_start = pos
+                gene_end = pos
+                for i in range(rng.randint(1, max_isoforms)):
+                    tid = 'ENST%011d' % ((g + 1) * 100 + i)
+                    start = gene_start + rng.randint(0, 100)
+                    exons = list()
+                    for e in range(rng.randint(1, max_exons)):
+                        end = start + rng.randint(50, 500)
+                        exons.append((start, end))
+                        start = end + rng.randint(100, 3000)
+                    gene_end = max(gene_end, exons[-1][1])
+                    self.transcripts.append((tid, gid, chrom, strand, exons))
+
+                    attrs = 'gene_id "%s"; gene_version "1"; transcript_id "%s"; transcript_version "1";' % (gid, tid)
+                    fh.write('\t'.join([chrom, 'synthetic', 'transcript', str(exons[0][0]), str(exons[-1][1]), '.', strand, '.', attrs]) + '\n')
+                    num_lines += 1
+                    num_exons = len(exons)
+                    for n, (s, e) in enumerate(exons):
+                        exon_number = n + 1 if strand == '+' else num_exons - n
+                        fh.write('\t'.join([chrom, 'synthetic', 'exon', str(s), str(e), '.', strand, '.',
+                                            attrs + ' exon_number "%d";' % exon_number]) + '\n')
+                        num_lines += 1
+                pos = gene_end + rng.randint(1000, 10000)
+            self.chroms.append((chrom, pos))
+        self.counts['gtf_lines'] = num_lines
+        self.counts['transcripts'] = len(self.transcripts)
+
+    def write_ids(self, truth_prop):
+        rng = self.rng
+        tids = list(t[0] for t in self.transcripts)
+        truth = rng.sample(tids, max(1, int(len(tids) * truth_prop)))
+        self.truth = set(truth)
+        with open(self.path('truth.txt'), 'wt') as fh:
+            for tid in truth:
+                fh.write(tid + '\n')
+        with open(self.path('tpm.tsv'), 'wt') as fh:
+            fh.write('ID\test_counts\tTPM\n')
+            for tid in tids:
+                count = rng.randint(0, 1000)
+                fh.write(tid + '\t' + str(count) + '\t' + str(count * 1.5) + '\n')
+        self.counts['truth_ids'] = len(truth)
+        self.counts['tpm_lines'] = len(tids)
+
+    # GTF file whose `transcript_id` attributes are quoted, unquoted, missing the closing quote or
+    # preceded by keys ending in `transcript_id`; lines without the attribute are filtered out
+    def write_attribute_gtf(self, num_transcripts):
+        num_lines = 0
+        num_kept = 0
+        with open(self.path('attributes.gtf'), 'wt') as fh:
+            for i, (tid, gid, chrom, strand, exons) in enumerate(self.transcripts[:num_transcripts]):
+                fmt = i % 5
+                if fmt == 0:
+                    attrs = 'gene_id "%s"; transcript_id "%s";' % (gid, tid)
+                elif fmt == 1:
+                    attrs = 'gene_id %s; transcript_id %s;' % (gid, tid)
+                elif fmt == 2:
+                    attrs = 'gene_id "%s"; transcript_id "%s' % (gid, tid)
+                elif fmt == 3:
+                    attrs = 'gene_id "%s"; original_transcript_id "%s"; transcript_id "%s";' % (gid, tid + 'X', tid)
+                else:
+                    attrs = 'gene_id "%s";' % gid
+                fh.write('\t'.join([chrom, 'synthetic', 'transcript', str(exons[0][0]), str(exons[-1][1]), '.', strand, '.', attrs]) + '\n')
+                num_lines += 1
+                if fmt != 4 and tid in self.truth:
+                    num_kept += 1
+        self.counts['attribute_gtf_lines'] = num_lines
+        self.counts['attribute_gtf_kept'] = num_kept
+
+    # polyA site atlas BED file starting with a site spanning each chromosome on the `+` strand,
+    # followed by short sites within the genes; the sites of different genes do not overlap
+    def write_atlas(self, max_sites):
+        rng = self.rng
+        genes = dict()
+        for tid, gid, chrom, strand, exons in self.transcripts:
+            genes.setdefault(gid, list()).append((tid, chrom, strand, exons))
+        polya_tids = set()
+        num_sites = 0
+        with open(self.path('atlas.bed'), 'wt') as fh:
+            for chrom, length in self.chroms:
+                fh.write('\t'.join([chrom, '0', str(length), 'long', '0', '+']) + '\n')
+                num_sites += 1
+            for gid, transcripts in genes.items():
+                chrom = transcripts[0][1]
+                gene_start = min(t[3][0][0] for t in transcripts)
+                gene_end = max(t[3][-1][1] for t in transcripts)
+                sites = list()
+                for i in range(rng.randint(0, max_sites)):
+                    start = rng.randint(gene_start, gene_end)
+                    end = min(gene_end, start + rng.randint(0, 30))
+                    sites.append((start, end, rng.choice('+-')))
+                    fh.write('\t'.join([chrom, str(start - 1), str(end), gid, '0', sites[-1][2]]) + '\n')
+                    num_sites += 1
+                for tid, chrom, strand, exons in transcripts:
+                    # the 3'-terminal exon
+                    exon_start, exon_end = exons[-1] if strand == '+' else exons[0]
+                    if strand == '+' or any(s <= exon_end and e >= exon_start and st == strand for s, e, st in sites):
+                        polya_tids.add(tid)
+        self.counts['atlas_sites'] = num_sites
+        self.counts['polya_tids'] = len(polya_tids)
+
+    # Trans-NanoSim simulated reads; some transcript IDs carry a version and some are not in the GTF file
+    def write_reads(self, max_reads):
+        rng = self.rng
+        num_reads = 0
+        num_known_reads = 0
+        with open(self.path('reads.fq'), 'wt') as fh:
+            for i, t in enumerate(self.transcripts + [('ENST99999999999', None), ('ENST99999999998.2', None)]):
+                tid = t[0]
+                if t[1] and rng.random() < 0.25:
+                    tid += '.' + str(rng.randint(1, 9))
+                for r in range(rng.randint(1, max_reads)):
+                    fh.write('@%s_%d_aligned_%d_F_0_100_0\nACGT\n+\nIIII\n' % (tid, i, r))
+                    num_reads += 1
+                    if t[1]:
+                        num_known_reads += 1
+        self.counts['reads'] = num_reads
+        self.counts['known_reads'] = num_known_reads
+
+    # CIGAR string with `num_ops` indels that are mostly short
+    def get_cigar(self, num_ops):
+        rng = self.rng
+        ops = list()
+        for i in range(num_ops):
+            ops.append(str(rng.randint(10, 200)) + 'M')
+            length = rng.randint(1, 5) if rng.random() < 0.99 else rng.randint(20, 100)
+            ops.append(str(length) + rng.choice('DI'))
+        ops.append(str(rng.randint(10, 200)) + 'M')
+        return ''.join(ops)
+
+    def get_paf_line(self, cid, clen, qstart, qend, tid, tlen, tstart, tend, min_pid, cigar_ops):
+        blen = max(tend - tstart, qend - qstart)
+        nmatch = int(blen * self.rng.uniform(min_pid, 1.0))
+        return '\t'.join([cid, str(clen), str(qstart), str(qend), '+',
+                          tid + '.1', str(tlen), str(tstart), str(tend), str(nmatch), str(blen), '60',
+                          'NM:i:' + str(blen - nmatch), 'tp:A:P', 'cg:Z:' + self.get_cigar(cigar_ops)]) + '\n'
+
+    def write_assembly(self, num_contigs, max_hits, cigar_ops):
+        rng = self.rng
+        txpt_lengths = list((t[0], sum(e - s + 1 for s, e in t[4])) for t in self.transcripts)
+        num_hits = 0
+        with open(self.path('aln.paf'), 'wt') as fh_paf, open(self.path('assembly.fa'), 'wt') as fh_fa:
+            for c in range(num_contigs):
+                cid = 'contig_%d' % c
+                tid, tlen = rng.choice(txpt_lengths)
+                if rng.random() < 0.5:
+                    tstart, tend = 0, tlen
+                else:
+                    tstart = rng.randint(0, tlen // 2)
+                    tend = rng.randint(tstart + (tlen - tstart) // 2, tlen)
+                qstart = rng.randint(0, 20)
+                qend = qstart + tend - tstart
+                chimeric = rng.random() < 0.05
+                if chimeric:
+                    tid2, tlen2 = rng.choice(txpt_lengths)
+                    clen = qend + tlen2 + rng.randint(0, 20)
+                else:
+                    clen = qend + rng.randint(0, 20)
+
+                seq = ''.join(rng.choices(BASES, k=clen))
+                fh_fa.write('>' + cid + '\n')
+                for i in range(0, clen, 60):
+                    fh_fa.write(seq[i:i+60] + '\n')
+
+                # some contigs are unaligned
+                if rng.random() < 0.1:
+                    continue
+
+                fh_paf.write(self.get_paf_line(cid, clen, qstart, qend, tid, tlen, tstart, tend, 0.95, cigar_ops))
+                num_hits += 1
+                # weaker hits of the same region to other transcripts
+                for h in range(rng.randint(0, max_hits - 1)):
+                    alt_tid, alt_tlen = rng.choice(txpt_lengths)
+                    alt_tend = min(alt_tlen, tend - tstart)
+                    fh_paf.write(self.get_paf_line(cid, clen, qstart, qend, alt_tid, alt_tlen, 0, alt_tend, 0.8, cigar_ops))
+                    num_hits += 1
+                if chimeric:
+                    fh_paf.write(self.get_paf_line(cid, clen, qend, qend + tlen2, tid2, tlen2, 0, tlen2, 0.95, cigar_ops))
+                    num_hits += 1
+        self.counts['contigs'] = num_contigs
+        self.counts['paf_lines'] = num_hits
+
+    def write_bams(self, num_contigs, reads_per_split):
+        try:
+            import pysam
+        except ImportError:
+            return False
+
+        rng = self.rng
+        header = {'HD': {'VN': '1.6', 'SO': 'unsorted'},
+                  'SQ': list({'SN': name, 'LN': length} for name, length in self.chroms)}
+        ref_ids = dict((name, i) for i, (name, length) in enumerate(self.chroms))
+
+        def new_alignment(name, chrom, pos, cigar, flag):
+            a = pysam.AlignedSegment()
+            a.query_name = name
+            a.flag = flag
+            a.reference_id = ref_ids[chrom]
+            a.reference_start = pos
+            a.mapping_quality = 60
+            a.cigarstring = cigar
+            return a
+
+        num_chroms = len(self.chroms)
+        c2g_unsorted = self.path('contigs.unsorted.bam')
+        r2c_unsorted = self.path('reads.unsorted.bam')
+        with pysam.AlignmentFile(c2g_unsorted, 'wb', header=header) as c2g, \
+            pysam.AlignmentFile(r2c_unsorted, 'wb', header=header) as r2c:
+            num_reads = 0
+            for c in range(num_contigs):
+                cid = 'contig_%d' % c
+                i = rng.randrange(num_chroms)
+                chrom1, len1 = self.chroms[i]
+                pos1 = rng.randint(0, len1 - 2000)
+                if num_chroms < 2 or rng.random() < 0.5:
+                    # unsplit contig
+                    c2g.write(new_alignment(cid, chrom1, pos1, '1000M', 0))
+                    continue
+
+                # contig split between two chromosomes
+                chrom2, len2 = self.chroms[(i + rng.randint(1, num_chroms - 1)) % num_chroms]
+                pos2 = rng.randint(0, len2 - 2000)
+                m1 = rng.randint(300, 700)
+                m2 = 1000 - m1
+                aln1 = new_alignment(cid, chrom1, pos1, '%dM%dS' % (m1, m2), 0)
+                aln2 = new_alignment(cid, chrom2, pos2, '%dH%dM' % (m1, m2), 2048)
+                aln1.set_tag('SA', '%s,%d,+,%dS%dM,60,0;' % (chrom2, pos2 + 1, m1, m2))
+                aln2.set_tag('SA', '%s,%d,+,%dM%dS,60,0;' % (chrom1, pos1 + 1, m1, m2))
+                c2g.write(aln1)
+                c2g.write(aln2)
+
+                # read pairs spanning the breakpoint
+                for r in range(rng.randint(0, reads_per_split)):
+                    name = 'read_%d' % num_reads
+                    num_reads += 1
+                    r1 = new_alignment(name, chrom1, pos1 + m1 - rng.randint(100, 190), '100M', 1 | 64)
+                    r2 = new_alignment(name, chrom2, pos2 + rng.randint(0, 90), '100M', 1 | 16 | 128)
+                    r2c.write(r1)
+                    r2c.write(r2)
+
+        for name, unsorted in [('contigs.bam', c2g_unsorted), ('reads.bam', r2c_unsorted)]:
+            pysam.sort('--no-PG', '-o', self.path(name), unsorted)
+            pysam.index(self.path(name))
+            os.remove(unsorted)
+        self.counts['bam_contigs'] = num_contigs
+        self.counts['bam_reads'] = num_reads
+        return True
+
+def generate_inputs(args, with_bams):
+    data = SyntheticData(args.outdir, args.seed)
+    data.write_gtf(args.genes, args.max_isoforms, args.max_exons)
+    data.write_ids(args.truth_prop)
+    data.write_attribute_gtf(1000)
+    data.write_reads(10)
+    data.write_assembly(args.contigs, args.hits, args.cigar_ops)
+    has_bams = with_bams and data.write_bams(args.split_contigs, args.split_reads)
+    data.write_atlas(3)
+    return data.counts, has_bams
+
+# run a command and measure its wall time, CPU time and peak RSS
+#
+# The peak RSS of a child process includes that of the process it was forked from,
+# which is therefore kept small by generating the inputs in a separate process.
+def run_stage(name, cmd, stdout_path, records):
+    start = time.perf_counter()
+    # stderr is spooled to a temporary file rather than a pipe, which the child could fill
+    # and block on while it is waited for
+    with open(stdout_path, 'wb') as fw, tempfile.TemporaryFile() as ferr:
+        proc = subprocess.Popen(cmd, stdout=fw, stderr=ferr)
+        # `wait4` reports the resource usage of this child only
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        # the child has been reaped by `wait4`
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        ferr.seek(0)
+        stderr = ferr.read().decode()
+    wall = time.perf_counter() - start
+    returncode = proc.returncode
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('stage `' + name + '` failed with exit code ' + str(returncode))
+
+    result = {
+        'name': name,
+        'cmd': cmd,
+        'wall_s': round(wall, 4),
+        'user_s': round(rusage.ru_utime, 4),
+        'sys_s': round(rusage.ru_stime, 4),
+        'max_rss_kb': rusage.ru_maxrss,
+    }
+    for unit, num in records.items():
+        result[unit] = num
+        result[unit + '_per_s'] = round(num / wall, 1) if wall > 0 else None
+    return result
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args):
+    os.makedirs(args.outdir, exist_ok=True)
+    stages = args.stages if args.stages else STAGES
+    py = sys.executable
+
+    def script(name):
+        return os.path.join(SCRIPT_DIR, name)
+
+    def path(name):
+        return os.path.join(args.outdir, name)
+
+    def out(name):
+        return path('out_' + name)
+
+    # generate inputs
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        counts, has_bams = pool.apply(generate_inputs, (args, 'check_splits' in stages))
+    generate_s = round(time.perf_counter() - start, 4)
+
+    gtf = path('annotation.gtf')
+    gtf_lines = {'lines': counts['gtf_lines']}
+    results = list()
+
+    # stages parsing the GTF text must run before the index is built
+    if 'gtf_features' in stages:
+        for mode in ['length', 'count']:
+            results.append(run_stage('gtf_features_' + mode,
+                                     [py, script('gtf_features.py'), mode, gtf, '--summary'],
+                                     out('gtf_features_' + mode + '.txt'), gtf_lines))
+        results.append(run_stage('gtf_features_bed',
+                                 [py, script('gtf_features.py'), 'bed', gtf, '--feature', 'intron'],
+                                 out('gtf_features_bed.txt'), gtf_lines))
+        results.append(run_stage('gtf_features_all',
+                                 [py, script('gtf_features.py'), 'all', gtf, out('gtf_features_all_')],
+                                 out('gtf_features_all.txt'), gtf_lines))
+
+    if 'gtf_isoforms_per_gene' in stages:
+        results.append(run_stage('gtf_isoforms_per_gene',
+                                 [py, script('gtf_isoforms_per_gene.py'), gtf, '--summary'],
+                                 out('gtf_isoforms_per_gene.txt'), gtf_lines))
+
+    if 'gtf_filter' in stages:
+        results.append(run_stage('gtf_filter',
+                                 [py, script('gtf_filter.py'), gtf, path('truth.txt')],
+                                 out('gtf_filter.gtf'), gtf_lines))
+        results.append(run_stage('gtf_filter_attributes',
+                                 [py, script('gtf_filter.py'), path('attributes.gtf'), path('truth.txt')],
+                                 out('gtf_filter_attributes.gtf'), {'lines': counts['attribute_gtf_lines']}))
+        # the transcript IDs are found in all formats of the attribute
+        with open(out('gtf_filter_attributes.gtf')) as fh:
+            num_kept = sum(1 for line in fh)
+        if num_kept != counts['attribute_gtf_kept']:
+            raise RuntimeError('stage `gtf_filter_attributes` kept ' + str(num_kept) + ' lines instead of ' +
+                               str(counts['attribute_gtf_kept']))
+
+    if 'get_polya_tids' in stages:
+        results.append(run_stage('get_polya_tids',
+                                 [py, script('get_polya_tids.py'), gtf, path('atlas.bed')],
+                                 out('get_polya_tids.txt'), {'transcripts': counts['transcripts']}))
+        # the long sites are indexed together with the short sites that follow them
+        with open(out('get_polya_tids.txt')) as fh:
+            num_found = sum(1 for line in fh)
+        if num_found != counts['polya_tids']:
+            raise RuntimeError('stage `get_polya_tids` found ' + str(num_found) + ' transcripts instead of ' +
+                               str(counts['polya_tids']))
+
+    if 'tns_gene_exp' in stages:
+        results.append(run_stage('tns_gene_exp',
+                                 [py, script('tns_gene_exp.py'), path('tpm.tsv'), gtf],
+                                 out('tns_gene_exp.tsv'), {'lines': counts['tpm_lines']}))
+        results.append(run_stage('tns_gene_exp_fastq',
+                                 [py, script('tns_gene_exp.py'), path('reads.fq'), gtf, '--fastq'],
+                                 out('tns_gene_exp_fastq.tsv'), {'reads': counts['reads']}))
+        # the reads of versioned transcript IDs are counted and those of unknown IDs are skipped
+        with open(out('tns_gene_exp_fastq.tsv')) as fh:
+            fh.readline()
+            num_counted = sum(int(line.split('\t')[1]) for line in fh)
+        if num_counted != counts['known_reads']:
+            raise RuntimeError('stage `tns_gene_exp_fastq` counted ' + str(num_counted) + ' reads instead of ' +
+                               str(counts['known_reads']))
+
+    if 'tns_eval' in stages:
+        result = run_stage('tns_eval',
+                           [py, script('tns_eval.py'), path('assembly.fa'), path('aln.paf'),
+                            path('truth.txt'), gtf, out('tns_eval_'),
+                            '--tpm', path('tpm.tsv'), '--threads', str(args.threads), '--profile'],
+                           out('tns_eval_summary.txt'),
+                           {'lines': counts['paf_lines'], 'contigs': counts['contigs']})
+        with open(out('tns_eval_timing.json')) as fh:
+            result['phases'] = json.load(fh)['phases']
+        results.append(result)
+
+    if has_bams:
+        results.append(run_stage('check_splits',
+                                 [py, script('check_splits.py'), path('contigs.bam'), path('reads.bam'),
+                                  '--threads', str(args.threads)],
+                                 out('check_splits.txt'), {'contigs': counts['bam_contigs']}))
+        results.append(run_stage('check_splits_sa',
+                                 [py, script('check_splits.py'), path('contigs.bam'), path('reads.bam'),
+                                  '--sa', '--threads', str(args.threads)],
+                                 out('check_splits_sa.txt'), {'contigs': counts['bam_contigs']}))
+
+    if 'gtf_index' in stages:
+        results.append(run_stage('gtf_index',
+                                 [py, script('gtf_index.py'), gtf],
+                                 out('gtf_index.txt'), gtf_lines))
+        if 'gtf_isoforms_per_gene' in stages:
+            results.append(run_stage('gtf_isoforms_per_gene_indexed',
+                                     [py, script('gtf_isoforms_per_gene.py'), gtf, '--summary'],
+                                     out('gtf_isoforms_per_gene_indexed.txt'), gtf_lines))
+        os.remove(gtf + '.gtfidx')
+
+    report = {
+        'commit': get_commit(),
+        'launcher_max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': dict((k, v) for k, v in vars(args).items() if k not in ('outdir', 'output')),
+        'inputs': counts,
+        'generate_s': generate_s,
+        'stages': results,
+    }
+    if 'check_splits' in stages and not has_bams:
+        report['skipped'] = ['check_splits (pysam is not installed)']
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scripts on synthetic inputs')
+    parser.add_argument('outdir', help='path of output directory for synthetic inputs and outputs')
+    parser.add_argument('--output', metavar='JSON',
+                        help='path of output JSON report (default: OUTDIR/benchmark.json)')
+    parser.add_argument('--seed', default='1', metavar='INT', type=int,
+                        help='seed for the random number generator (default: %(default)s)')
+    parser.add_argument('--genes', default='2000', metavar='INT', type=int,
+                        help='number of genes in GTF (default: %(default)s)')
+    parser.add_argument('--max_isoforms', default='5', metavar='INT', type=int,
+                        help='maximum number of isoforms per gene (default: %(default)s)')
+    parser.add_argument('--max_exons', default='10', metavar='INT', type=int,
+                        help='maximum number of exons per isoform (default: %(default)s)')
+    parser.add_argument('--truth_prop', default='0.5', metavar='FLOAT', type=float,
+                        help='proportion of transcripts in the truth set (default: %(default)s)')
+    parser.add_argument('--contigs', default='20000', metavar='INT', type=int,
+                        help='number of assembly contigs (default: %(default)s)')
+    parser.add_argument('--hits', default='5', metavar='INT', type=int,
+                        help='maximum number of PAF hits per contig (default: %(default)s)')
+    parser.add_argument('--cigar_ops', default='100', metavar='INT', type=int,
+                        help='number of indel operations per CIGAR (default: %(default)s)')
+    parser.add_argument('--split_contigs', default='2000', metavar='INT', type=int,
+                        help='number of contigs in contig-to-genome BAM (default: %(default)s)')
+    parser.add_argument('--split_reads', default='20', metavar='INT', type=int,
+                        help='maximum number of read pairs per split contig (default: %(default)s)')
+    parser.add_argument('--threads', default='1', metavar='INT', type=int,
+                        help='number of threads for `tns_eval.py` and `check_splits.py` (default: %(default)s)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, metavar='STAGE',
+                        help='stages to run: ' + ', '.join(STAGES) + ' (default: all)')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    output = args.output if args.output else os.path.join(args.outdir, 'benchmark.json')
+    with open(output, 'wt') as fw:
+        json.dump(report, fw, indent=2)
+        fw.write('\n')
+
+    for stage in report['stages']:
+        print(stage['name'], str(stage['wall_s']) + 's', str(stage['max_rss_kb']) + 'KB', sep='\t')
@@ -1,7 +1,9 @@
+import argparse
+import multiprocessing
 import pysam
-import sys
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import re
+import sys
 
 # Written by Readman Chiu
 
@@ -15,15 +17,42 @@ def get_secondary_alignments(aln):
 
     return mappings
 
-def find_splits(aln):
+def find_splits(aln, min_clip=1):
+    return find_cigar_splits(aln.cigartuples, min_clip)
+
+def find_cigar_splits(cigartuples, min_clip=1):
     ends = []
-    if aln.cigartuples[-1][0] >= 4:
+    if cigartuples[-1][0] >= 4 and cigartuples[-1][1] >= min_clip:
         ends.append('end')
-    if aln.cigartuples[0][0] >= 4:
+    if cigartuples[0][0] >= 4 and cigartuples[0][1] >= min_clip:
         ends.append('start')
 
     return ends
 
+cigar_regex = re.compile(r'(\d+)([MIDNSHP=X])')
+cigar_op_codes = dict((op, i) for i, op in enumerate('MIDNSHP=X'))
+# M, D, N, =, X
+ref_consuming_ops = {0, 2, 3, 7, 8}
+
+def parse_cigar(cigar):
+    return [(cigar_op_codes[op], int(length)) for length, op in cigar_regex.findall(cigar)]
+
+# lightweight copies of the alignments listed in the SA tag of `aln`
+def get_sa_split_alignments(aln, min_clip, min_mapq):
+    split_alns = []
+    for mapping in aln.get_tag('SA').split(';'):
+        if mapping:
+            chrom, start, strand, cigar, mapq, nm = mapping.split(',')
+            if int(mapq) < min_mapq:
+                continue
+            cigartuples = parse_cigar(cigar)
+            ends = find_cigar_splits(cigartuples, min_clip)
+            if ends:
+                ref_start = int(start) - 1
+                ref_end = ref_start + sum(length for op, length in cigartuples if op in ref_consuming_ops)
+                split_alns.append(((chrom, ref_start, ref_end, strand == '-', cigar), ends))
+    return split_alns
+
 def find_splits_old(aln, min_split_size=100, closeness_in_size=200):
     """ aln must have been checked if it has SA """
     '''
@@ -76,52 +105,93 @@ def find_splits_old(aln, min_split_size=100, closeness_in_size=200):
 
     return splits
 
-def get_reads(bam, ref, start, end, strand):
-    reads = {}
-    for aln in bam.fetch(ref, start, end):
-        #if aln.is_proper_pair:
-        #    continue
-        if (strand == '+' and not aln.is_reverse) or (strand == '-' and aln.is_reverse):
-            mate = 1 if aln.is_read1 else 2
-            reads[aln.query_name] = mate
+# maximum length of a region of merged windows fetched at once
+max_region_size = 100000
 
-    return reads
+# maximum numbers of fetched regions and window read maps kept in the caches
+max_cached_regions = 64
+max_cached_windows = 4096
 
-c2g_file = sys.argv[1]
-c2g = pysam.AlignmentFile(c2g_file)
-r2c_file = sys.argv[2]
-r2c = pysam.AlignmentFile(r2c_file)
-
-splits = {}
-for aln in c2g.fetch(until_eof=True):
-    if aln.is_unmapped:
-        continue
-    if not aln.query_name in splits:
-        splits[aln.query_name] = defaultdict(list)
-    ends = find_splits(aln)
-    for end in ends:
-        splits[aln.query_name][end].append(aln)
-
-w = 200
-check_reads = []
-for ctg in sorted(splits.keys()):
-    if 'start' in splits[ctg] and 'end' in splits[ctg]:
-        for aln1 in splits[ctg]['end']:
-            for aln2 in splits[ctg]['start']:
-                ref1_rlen = c2g.get_reference_length(aln1.reference_name)
-                ref2_rlen = c2g.get_reference_length(aln2.reference_name)
-                if aln1 == aln2 or aln1.is_reverse != aln2.is_reverse or aln1.reference_name == aln2.reference_name:
-                    continue
-                print('ww', ctg, aln1.reference_name, aln1.reference_start, aln1.reference_end, ref1_rlen, aln1.is_reverse, aln1.cigarstring, aln2.reference_name, aln2.reference_start, aln2.reference_end, ref2_rlen, aln2.is_reverse, aln2.cigarstring)
+def merge_windows(windows, max_size):
+    # map each window (ref, start, end) to a region of overlapping windows on the same reference
+    window_regions = dict()
+    ref_windows = defaultdict(set)
+    for ref, start, end in windows:
+        ref_windows[ref].add((start, end))
+    for ref, spans in ref_windows.items():
+        region_spans = list()
+        region_start = None
+        region_end = None
+        for start, end in sorted(spans):
+            if region_start is not None and start <= region_end and max(end, region_end) - region_start <= max_size:
+                region_end = max(end, region_end)
+            else:
+                if region_start is not None:
+                    region = (ref, region_start, region_end)
+                    for span in region_spans:
+                        window_regions[(ref,) + span] = region
+                region_spans = list()
+                region_start = start
+                region_end = end
+            region_spans.append((start, end))
+        region = (ref, region_start, region_end)
+        for span in region_spans:
+            window_regions[(ref,) + span] = region
+    return window_regions
 
-                check_reads.append((ctg,\
-                                    (aln1.reference_name, max(0, aln1.reference_end - w), aln1.reference_end),\
-                                    (aln2.reference_name, aln2.reference_start, min(ref2_rlen, aln2.reference_start + w)),\
-                                    (aln1.cigarstring, aln2.cigarstring)))
+class ReadCache:
+    # Reads of windows are served from regions of merged windows, each fetched from the BAM file once.
+    # The reads of a window are those of its region that overlap it, in the same order as
+    # `bam.fetch` of the window would return them.
+    def __init__(self, bam, window_regions):
+        self.bam = bam
+        self.window_regions = window_regions
+        self.regions = OrderedDict()
+        self.windows = OrderedDict()
 
-for ctg, span1, span2, cigars in check_reads:
-    reads1 = get_reads(r2c, span1[0], span1[1], span1[2], '+')
-    reads2 = get_reads(r2c, span2[0], span2[1], span2[2], '-')
+    def get_region_alignments(self, region):
+        alns = self.regions.get(region)
+        if alns is None:
+            alns = list()
+            ref, start, end = region
+            for aln in self.bam.fetch(ref, start, end):
+                aln_start = aln.reference_start
+                aln_end = aln.reference_end
+                if aln_end is None:
+                    # same as the end used by `fetch` for alignments without reference length
+                    aln_end = aln_start + 1
+                alns.append((aln_start, aln_end, aln.query_name, aln.is_reverse, 1 if aln.is_read1 else 2))
+            self.regions[region] = alns
+            if len(self.regions) > max_cached_regions:
+                self.regions.popitem(last=False)
+        else:
+            self.regions.move_to_end(region)
+        return alns
+
+    def get_reads(self, ref, start, end, strand):
+        key = (ref, start, end, strand)
+        reads = self.windows.get(key)
+        if reads is not None:
+            self.windows.move_to_end(key)
+            return reads
+
+        reads = {}
+        is_reverse = strand == '-'
+        for aln_start, aln_end, query_name, aln_is_reverse, mate in \
+            self.get_region_alignments(self.window_regions[(ref, start, end)]):
+            if aln_start >= end:
+                break
+            if aln_end > start and aln_is_reverse == is_reverse:
+                reads[query_name] = mate
+
+        self.windows[key] = reads
+        if len(self.windows) > max_cached_windows:
+            self.windows.popitem(last=False)
+        return reads
+
+def check_split_reads(read_cache, ctg, span1, span2, cigars):
+    reads1 = read_cache.get_reads(span1[0], span1[1], span1[2], '+')
+    reads2 = read_cache.get_reads(span2[0], span2[1], span2[2], '-')
 
     paired = []
     for read in reads1.keys():
@@ -129,5 +199,234 @@ for ctg, span1, span2, cigars in check_reads:
             paired.append(read)
             #print('rr', ctg, read, reads1[read], reads2[read])
     
-    print('qq', ctg, '{}:{}-{}'.format(span1[0], span1[1], span1[2]), cigars[0], '{}:{}-{}'.format(span2[0], span2[1], span2[2]), cigars[1], len(reads1), len(reads2), len(paired))
+    return ' '.join(['qq', ctg, '{}:{}-{}'.format(span1[0], span1[1], span1[2]), cigars[0], '{}:{}-{}'.format(span2[0], span2[1], span2[2]), cigars[1], str(len(reads1)), str(len(reads2)), str(len(paired))])
+
+# number of split pairs checked by a worker process at a time
+chunk_size = 1000
+
+def init_worker(r2c_file):
+    # each worker process reads the BAM file with its own handle and cache
+    global worker_read_cache
+    worker_read_cache = ReadCache(pysam.AlignmentFile(r2c_file), window_regions)
+
+def check_split_reads_chunk(chunk):
+    return list((i, check_split_reads(worker_read_cache, *split)) for i, split in chunk)
+
+def get_reference_chunks(check_reads, size):
+    # sort the split pairs by the position of their first window so that the BAM file
+    # is read in coordinate order and each worker process reads nearby regions
+    order = sorted(range(len(check_reads)),
+                   key=lambda i: (c2g.get_tid(check_reads[i][1][0]), check_reads[i][1][1]))
+    for i in range(0, len(order), size):
+        yield list((j, check_reads[j]) for j in order[i:i+size])
+
+# lightweight copy of the fields of a split alignment used for pairing
+def get_split_alignment(aln):
+    return (aln.reference_name, aln.reference_start, aln.reference_end, aln.is_reverse, aln.cigarstring)
+
+# the `ww` line and the read windows of an alignment clipped at its end paired with an alignment clipped at its start
+def get_split_pair(ctg, aln1, aln2, ref_lengths, w):
+    ref1, start1, end1, is_reverse1, cigar1 = aln1
+    ref2, start2, end2, is_reverse2, cigar2 = aln2
+    ref1_rlen = ref_lengths[ref1]
+    ref2_rlen = ref_lengths[ref2]
+    ww = ' '.join(str(x) for x in ['ww', ctg, ref1, start1, end1, ref1_rlen, is_reverse1, cigar1, ref2, start2, end2, ref2_rlen, is_reverse2, cigar2])
+    return (ww, (ctg,\
+                 (ref1, max(0, end1 - w), end1),\
+                 (ref2, start2, min(ref2_rlen, start2 + w)),\
+                 (cigar1, cigar2)))
+
+def pair_splits(ctg, end_alns, start_alns, ref_lengths, w):
+    # pair each alignment clipped at its end with each alignment clipped at its start on another reference
+    # alignments clipped at their start are bucketed by strand, so only pairs on the same strand are visited
+    start_alns_by_strand = {False: [], True: []}
+    for aln2 in start_alns:
+        start_alns_by_strand[aln2[3]].append(aln2)
+    pairs = []
+    for aln1 in end_alns:
+        for aln2 in start_alns_by_strand[aln1[3]]:
+            if aln1 is aln2 or aln1[0] == aln2[0]:
+                continue
+            pairs.append(get_split_pair(ctg, aln1, aln2, ref_lengths, w))
+    return pairs
+
+def is_split_candidate(aln, min_mapq):
+    return not aln.is_unmapped and aln.mapping_quality >= min_mapq
+
+def get_split_pairs(c2g, w, min_clip, min_mapq):
+    # keep the split alignments of all contigs
+    ref_lengths = dict(zip(c2g.references, c2g.lengths))
+    splits = {}
+    for aln in c2g.fetch(until_eof=True):
+        if not is_split_candidate(aln, min_mapq):
+            continue
+        ends = find_splits(aln, min_clip)
+        if ends:
+            if not aln.query_name in splits:
+                splits[aln.query_name] = defaultdict(list)
+            split_aln = get_split_alignment(aln)
+            for end in ends:
+                splits[aln.query_name][end].append(split_aln)
+
+    pairs = []
+    for ctg in sorted(splits.keys()):
+        if 'start' in splits[ctg] and 'end' in splits[ctg]:
+            pairs.extend(pair_splits(ctg, splits[ctg]['end'], splits[ctg]['start'], ref_lengths, w))
+    return pairs
+
+def pair_collated_splits(ctg, end_alns, start_alns, ref_ids, ref_lengths, w):
+    # pair the alignments in coordinate order, as for coordinate-sorted input; as with `samtools sort`,
+    # alignments at the same position are ordered by strand and then kept in input order
+    coord_key = lambda aln: (ref_ids[aln[0]], aln[1], aln[3])
+    end_alns.sort(key=coord_key)
+    start_alns.sort(key=coord_key)
+    return pair_splits(ctg, end_alns, start_alns, ref_lengths, w)
+
+def get_split_pairs_collated(c2g, w, min_clip, min_mapq):
+    # group the alignments of each contig on the fly; only the split pairs are kept
+    ref_ids = dict((ref, i) for i, ref in enumerate(c2g.references))
+    ref_lengths = dict(zip(c2g.references, c2g.lengths))
+    pairs = []
+    prev_ctg = None
+    end_alns = []
+    start_alns = []
+    for aln in c2g.fetch(until_eof=True):
+        ctg = aln.query_name
+        if ctg != prev_ctg:
+            if end_alns and start_alns:
+                pairs.extend(pair_collated_splits(prev_ctg, end_alns, start_alns, ref_ids, ref_lengths, w))
+            end_alns = []
+            start_alns = []
+            prev_ctg = ctg
+        if not is_split_candidate(aln, min_mapq):
+            continue
+        ends = find_splits(aln, min_clip)
+        if ends:
+            split_aln = get_split_alignment(aln)
+            if 'end' in ends:
+                end_alns.append(split_aln)
+            if 'start' in ends:
+                start_alns.append(split_aln)
+    if end_alns and start_alns:
+        pairs.extend(pair_collated_splits(prev_ctg, end_alns, start_alns, ref_ids, ref_lengths, w))
+
+    # same order as for unsorted input
+    pairs.sort(key=lambda pair: pair[1][0])
+    return pairs
+
+# start of the aligned part of a split alignment in the orientation of the contig,
+# i.e. the length of the clip that precedes it in the contig
+def get_contig_start(split_aln):
+    cigartuples = parse_cigar(split_aln[4])
+    op, length = cigartuples[-1] if split_aln[3] else cigartuples[0]
+    return length if op >= 4 else 0
+
+def pair_adjacent_splits(ctg, split_alns, ref_lengths, w):
+    # pair each split alignment with the next one along the contig, so each split of the contig
+    # gives at most one pair; on the reverse strand the next alignment is clipped at its end
+    split_alns.sort(key=lambda split: get_contig_start(split[0]))
+    pairs = []
+    for (aln1, ends1), (aln2, ends2) in zip(split_alns, split_alns[1:]):
+        if aln1[3] != aln2[3] or aln1[0] == aln2[0]:
+            continue
+        if aln1[3]:
+            aln1, ends1, aln2, ends2 = aln2, ends2, aln1, ends1
+        if 'end' in ends1 and 'start' in ends2:
+            pairs.append(get_split_pair(ctg, aln1, aln2, ref_lengths, w))
+    return pairs
+
+def get_split_pairs_sa(c2g, w, min_clip, min_mapq):
+    # only primary alignments with an SA tag are examined; their partners are taken from the tag
+    ref_lengths = dict(zip(c2g.references, c2g.lengths))
+    # split alignments of each contig, keyed by contig name
+    contig_splits = dict()
+    for aln in c2g.fetch(until_eof=True):
+        if not aln.has_tag('SA') or aln.is_secondary or aln.is_supplementary or aln.is_unmapped:
+            continue
+        split_alns = get_sa_split_alignments(aln, min_clip, min_mapq)
+        if aln.mapping_quality >= min_mapq:
+            ends = find_splits(aln, min_clip)
+            if ends:
+                split_alns.append((get_split_alignment(aln), ends))
+        if len(split_alns) >= 2:
+            contig_splits.setdefault(aln.query_name, []).extend(split_alns)
+
+    pairs = []
+    for ctg, split_alns in contig_splits.items():
+        pairs.extend(pair_adjacent_splits(ctg, split_alns, ref_lengths, w))
+
+    # same order as for unsorted input
+    pairs.sort(key=lambda pair: pair[1][0])
+    return pairs
+
+parser = argparse.ArgumentParser(description='Check split-alignments of contigs for read-pair support')
+parser.add_argument('c2g', help='path of contigs-to-genome alignment BAM file')
+parser.add_argument('r2c', help='path of reads-to-genome alignment BAM file')
+parser.add_argument('--window', dest='window', default='200', metavar='INT', type=int,
+                    help='size of read windows at each side of a split (default: %(default)s)')
+parser.add_argument('--min_clip', dest='min_clip', default='1', metavar='INT', type=int,
+                    help='minimum length of the clipped end of a split alignment (default: %(default)s)')
+parser.add_argument('--min_mapq', dest='min_mapq', default='0', metavar='INT', type=int,
+                    help='minimum mapping quality of contig alignments (default: %(default)s)')
+parser.add_argument('--collated', dest='collated', action='store_true',
+                    help='contig alignments are grouped by contig (e.g. sorted by name or collated)')
+parser.add_argument('--sa', dest='sa', action='store_true',
+                    help='pair the primary alignments of contigs with the split alignments in their SA tags')
+parser.add_argument('--output', dest='output', metavar='PATH', type=str,
+                    help='path of output file (default: stdout)')
+parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                    help='number of worker processes for checking read-pair support (default: %(default)s)')
+args = parser.parse_args()
+
+if args.collated and args.sa:
+    parser.error('--collated and --sa are mutually exclusive')
+
+c2g_file = args.c2g
+c2g = pysam.AlignmentFile(c2g_file)
+r2c_file = args.r2c
+
+if args.collated and c2g.header.get('HD', {}).get('SO') == 'coordinate':
+    parser.error(c2g_file + ' is sorted by coordinate; alignments must be grouped by contig for --collated')
+
+# the output is opened only after the arguments are validated
+out = open(args.output, 'wt') if args.output else sys.stdout
+
+if args.sa:
+    split_pairs = get_split_pairs_sa(c2g, args.window, args.min_clip, args.min_mapq)
+elif args.collated:
+    split_pairs = get_split_pairs_collated(c2g, args.window, args.min_clip, args.min_mapq)
+else:
+    split_pairs = get_split_pairs(c2g, args.window, args.min_clip, args.min_mapq)
+
+check_reads = []
+for ww, pair in split_pairs:
+    print(ww, file=out)
+    check_reads.append(pair)
+del split_pairs
+
+windows = set()
+for ctg, span1, span2, cigars in check_reads:
+    windows.add(span1)
+    windows.add(span2)
+window_regions = merge_windows(windows, max_region_size)
+
+# results are printed in order of the split pairs
+qq_lines = [None] * len(check_reads)
+chunks = get_reference_chunks(check_reads, chunk_size)
+if args.threads > 1:
+    # do not let the worker processes inherit unwritten output
+    out.flush()
+    with multiprocessing.get_context('fork').Pool(args.threads, init_worker, (r2c_file,)) as pool:
+        for results in pool.imap_unordered(check_split_reads_chunk, chunks):
+            for i, line in results:
+                qq_lines[i] = line
+else:
+    init_worker(r2c_file)
+    for chunk in chunks:
+        for i, line in check_split_reads_chunk(chunk):
+            qq_lines[i] = line
+for line in qq_lines:
+    print(line, file=out)
 
+if args.output:
+    out.close()
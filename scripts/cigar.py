@@ -0,0 +1,38 @@
+# Functions for CIGAR operations shared by the alignment-processing scripts
+
+# CIGAR operation codes of pysam `cigartuples`
+CIGAR_INS = 1
+CIGAR_DEL = 2
+
+# get the length of the largest insertion or deletion in a CIGAR string
+#
+# The bytes of the string are scanned once: the digits of each operation
+# length are accumulated until the operation byte, which is compared with `D`
+# and `I`. If `limit` is given, the scan stops at the first indel longer than
+# `limit`; the returned value is then larger than `limit` but not necessarily
+# the maximum.
+def get_max_indel(cigar, limit=None):
+    max_indel = 0
+    if cigar:
+        length = 0
+        for c in cigar.encode():
+            if c <= 57: # '9'
+                length = length * 10 + c - 48
+            else:
+                if (c == 68 or c == 73) and length > max_indel: # 'D' or 'I'
+                    max_indel = length
+                    if limit is not None and length > limit:
+                        return max_indel
+                length = 0
+    return max_indel
+
+# get the length of the largest insertion or deletion in pysam `cigartuples`
+def get_max_indel_from_cigartuples(cigartuples, limit=None):
+    max_indel = 0
+    if cigartuples:
+        for op, length in cigartuples:
+            if (op == CIGAR_INS or op == CIGAR_DEL) and length > max_indel:
+                max_indel = length
+                if limit is not None and length > limit:
+                    return max_indel
+    return max_indel
@@ -0,0 +1,187 @@
+import gzip
+import io
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Functions for opening plain, gzip'd, bgzip'd and zstd-compressed files shared by all scripts.
+#
+# The compression of an input file is detected by its magic bytes rather than its file extension:
+#   * BGZF blocks are inflated in parallel by a thread pool when `threads` > 1
+#   * gzip streams are decompressed by an external `pigz` process when `threads` > 1 and `pigz` is available
+#   * zstd streams are decompressed by an external `zstd` process
+# Files are read in large binary buffers and, in text mode, decoded as lines are consumed.
+
+BUFFER_SIZE = 1 << 20
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSION_NONE = None
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_BGZF = 'bgzf'
+COMPRESSION_ZSTD = 'zstd'
+
+# BGZF block header: gzip header with a single `BC` extra subfield holding the block size
+BGZF_HEADER_SIZE = 18
+BGZF_FOOTER_SIZE = 8
+
+# number of BGZF blocks (64 KB each) read per thread at a time
+BGZF_BLOCKS_PER_THREAD = 16
+
+def is_bgzf_header(header):
+    return len(header) >= BGZF_HEADER_SIZE and \
+        header[:2] == GZIP_MAGIC and \
+        header[3] & 4 and \
+        struct.unpack_from('<H', header, 10)[0] == 6 and \
+        header[12:14] == b'BC' and \
+        struct.unpack_from('<H', header, 14)[0] == 2
+
+def detect_compression(file_path):
+    if not os.path.isfile(file_path):
+        # cannot peek into pipes; fall back to the file extension
+        if file_path.lower().endswith('.gz'):
+            return COMPRESSION_GZIP
+        return COMPRESSION_NONE
+
+    with open(file_path, 'rb') as fh:
+        header = fh.read(BGZF_HEADER_SIZE)
+    if header[:2] == GZIP_MAGIC:
+        if is_bgzf_header(header):
+            return COMPRESSION_BGZF
+        return COMPRESSION_GZIP
+    if header[:4] == ZSTD_MAGIC:
+        return COMPRESSION_ZSTD
+    return COMPRESSION_NONE
+
+def inflate_bgzf_block(cdata):
+    return zlib.decompress(cdata, -15)
+
+# raw reader of BGZF files that inflates batches of blocks in parallel
+class BgzfReader(io.RawIOBase):
+    def __init__(self, file_path, threads):
+        self._fh = open(file_path, 'rb', buffering=BUFFER_SIZE)
+        self._executor = ThreadPoolExecutor(threads)
+        self._batch_size = threads * BGZF_BLOCKS_PER_THREAD
+        self._buffer = b''
+        self._pos = 0
+        # inflate the next batch while the current one is being consumed
+        self._pending = self._submit_batch()
+
+    def readable(self):
+        return True
+
+    def _submit_batch(self):
+        futures = list()
+        for i in range(self._batch_size):
+            header = self._fh.read(BGZF_HEADER_SIZE)
+            if len(header) == 0:
+                break
+            if not is_bgzf_header(header):
+                raise ValueError('Invalid BGZF block in ' + self._fh.name)
+            block_size = struct.unpack_from('<H', header, 16)[0] + 1
+            data = self._fh.read(block_size - BGZF_HEADER_SIZE)
+            if len(data) != block_size - BGZF_HEADER_SIZE:
+                raise EOFError('Truncated BGZF block in ' + self._fh.name)
+            futures.append(self._executor.submit(inflate_bgzf_block, data[:-BGZF_FOOTER_SIZE]))
+        return futures
+
+    def tell_compressed(self):
+        return self._fh.tell()
+
+    def readinto(self, b):
+        while self._pos >= len(self._buffer):
+            if len(self._pending) == 0:
+                return 0
+            current = self._pending
+            self._pending = self._submit_batch()
+            self._buffer = b''.join(f.result() for f in current)
+            self._pos = 0
+
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos:self._pos+n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            for f in self._pending:
+                f.cancel()
+            self._executor.shutdown()
+            self._fh.close()
+        super().close()
+
+# raw reader of the standard output of a decompression process
+class ProcessReader(io.RawIOBase):
+    def __init__(self, cmd):
+        self._cmd = cmd
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=BUFFER_SIZE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._proc.stdout.readinto(b)
+        if n == 0 and self._proc.wait() != 0:
+            raise IOError('Command failed: ' + ' '.join(self._cmd))
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._proc.stdout.close()
+            if self._proc.poll() is None:
+                # stopped reading early
+                self._proc.terminate()
+            self._proc.wait()
+        super().close()
+
+def open_decompressed(file_path, threads=1):
+    compression = detect_compression(file_path)
+
+    if compression == COMPRESSION_BGZF and threads > 1:
+        return io.BufferedReader(BgzfReader(file_path, threads), BUFFER_SIZE)
+
+    if compression == COMPRESSION_ZSTD:
+        zstd = shutil.which('zstd')
+        if not zstd:
+            raise RuntimeError('`zstd` is required to read ' + file_path)
+        return io.BufferedReader(ProcessReader([zstd, '-dcq', file_path]), BUFFER_SIZE)
+
+    if compression == COMPRESSION_GZIP or compression == COMPRESSION_BGZF:
+        pigz = shutil.which('pigz')
+        if pigz and threads > 1:
+            return io.BufferedReader(ProcessReader([pigz, '-dc', '-p', str(threads), file_path]), BUFFER_SIZE)
+        return io.BufferedReader(gzip.open(file_path, 'rb'), BUFFER_SIZE)
+
+    return open(file_path, 'rb', buffering=BUFFER_SIZE)
+
+# get the number of bytes of the input file read so far by a file object from `gzopen`;
+# returns None if it is unknown (e.g. the file is decompressed by an external process)
+def get_read_position(fh):
+    raw = fh
+    if isinstance(raw, io.TextIOWrapper):
+        raw = raw.buffer
+    if isinstance(raw, io.BufferedReader):
+        raw = raw.raw
+    if isinstance(raw, BgzfReader):
+        return raw.tell_compressed()
+    if isinstance(raw, gzip.GzipFile):
+        raw = raw.fileobj
+    if isinstance(raw, (io.FileIO, io.BufferedReader)):
+        return raw.tell()
+    return None
+
+# function to open both compressed and regular files
+def gzopen(file_path, mode='rt', compresslevel=6, threads=1):
+    if 'r' in mode:
+        fh = open_decompressed(file_path, threads)
+        if 'b' in mode:
+            return fh
+        return io.TextIOWrapper(fh)
+
+    if file_path.lower().endswith('.gz'):
+        return gzip.open(file_path, mode=mode, compresslevel=compresslevel)
+    return open(file_path, mode, buffering=BUFFER_SIZE)
@@ -1,35 +1,56 @@
-from pybedtools import BedTool
 import argparse
-
-parser = argparse.ArgumentParser(description='Extract polyA transcript IDs.')
-parser.add_argument('gtf', metavar='GTF',
-                    help='annotation GTF file')
-parser.add_argument('atlas', metavar='BED',
-                    help='polyA site atlas BED file')
-args = parser.parse_args()
-
-gtf = args.gtf # e.g. `Mus_musculus.GRCm39.105.gtf.gz` (from Ensembl)
-atlas = args.atlas # e.g. `atlas.clusters.2.0.GRCm38.96.Mm39_liftover.bed` (liftover from PolyASite)
-
-# extract number of exons for each transcript
-num_exons_dict = dict()
-for t in BedTool(gtf).filter(lambda x : x[2] == 'exon'):
-    tid = t.attrs['transcript_id']
-    if tid in num_exons_dict:
-        num_exons_dict[tid] += 1
-    else:
-        num_exons_dict[tid] = 1
-
-terminus_exons = BedTool(gtf).filter(lambda x : x[2] == 'exon' and int(x.attrs['exon_number']) == num_exons_dict[x.attrs['transcript_id']])
-
-polya_sites = BedTool(atlas)
-
-polya_exons = terminus_exons.intersect(polya_sites, s=True)
-
-polya_transcript_ids = set()
-
-for r in polya_exons:
-    polya_transcript_ids.add(r.attrs['transcript_id'])
-
-for t in sorted(polya_transcript_ids):
-    print(t)
+from fileio import gzopen
+from gtf_features import exon_generator
+from interval_index import IntervalIndex
+
+# The GTF file is read once to find the 3'-terminal exon of each transcript, i.e. the exon with the
+# largest end on the `+` strand or the smallest start on the `-` strand, regardless of `exon_number`.
+# The polyA sites are loaded into an interval index and each terminal exon is tested for an overlap
+# with a site on the same strand, as with `bedtools intersect -s`.
+
+# get the 3'-terminal exon of each transcript as (chrom, start, end, strand)
+def get_terminal_exons(gtf):
+    terminal_exons = dict()
+    for chrom, start, end, strand, tid, gid in exon_generator(gtf):
+        exon = terminal_exons.get(tid)
+        if exon is None or \
+            (strand == '-' and start < exon[1]) or \
+            (strand != '-' and end > exon[2]):
+            terminal_exons[tid] = (chrom, start, end, strand)
+    return terminal_exons
+
+# load the sites of a BED file with strands (e.g. PolyASite) into an interval index
+def load_bed_index(bed):
+    index = IntervalIndex()
+    with gzopen(bed) as fh:
+        for line in fh:
+            if len(line.strip()) == 0 or line.startswith(('#', 'track', 'browser')):
+                continue
+            cols = line.rstrip('\r\n').split('\t')
+            strand = cols[5] if len(cols) > 5 else '.'
+            # BED intervals are 0-based and half-open
+            index.add(cols[0], int(cols[1]) + 1, int(cols[2]), strand)
+    index.build()
+    return index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract polyA transcript IDs.')
+    parser.add_argument('gtf', metavar='GTF',
+                        help='annotation GTF file')
+    parser.add_argument('atlas', metavar='BED',
+                        help='polyA site atlas BED file')
+    args = parser.parse_args()
+
+    gtf = args.gtf # e.g. `Mus_musculus.GRCm39.105.gtf.gz` (from Ensembl)
+    atlas = args.atlas # e.g. `atlas.clusters.2.0.GRCm38.96.Mm39_liftover.bed` (liftover from PolyASite)
+
+    polya_sites = load_bed_index(atlas)
+
+    polya_transcript_ids = set()
+
+    for tid, (chrom, start, end, strand) in get_terminal_exons(gtf).items():
+        if polya_sites.overlaps(chrom, start, end, strand):
+            polya_transcript_ids.add(tid)
+
+    for t in sorted(polya_transcript_ids):
+        print(t)
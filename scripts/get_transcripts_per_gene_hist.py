@@ -1,17 +1,14 @@
 import argparse
+from fileio import gzopen
+from gtf_index import load_gtf_index
+from id_index import load_ids
 
 parser = argparse.ArgumentParser(description='Extract the histogram of transcripts per gene')
 parser.add_argument('tids', help='path of transcript IDs')
 parser.add_argument('gtf', help='path of GTF for matching transcript to gene')
-parser.add_argument('--truth', help='path of ground truth transcript IDs for filtering')
+parser.add_argument('--truth', help='path of ground truth transcript IDs for filtering, or their index built by `id_index.py`')
 args = parser.parse_args()
 
-# function to open both gzip'd and regular files
-def gzopen(file_path, mode='rt', compresslevel=6):
-    if file_path.lower().endswith('.gz'):
-        return gzip.open(file_path, mode=mode, compresslevel=compresslevel)
-    return open(file_path, mode)
-
 # fix ENSEMBL gene/transcript names    
 def fix_name(name):
     if name.startswith('ENS'):
@@ -20,6 +17,11 @@ def fix_name(name):
 
 def get_gene_map(gtf):
     gene_map = dict()
+    gtf_idx = load_gtf_index(gtf)
+    if gtf_idx:
+        for tid, gid in gtf_idx.transcript_genes():
+            gene_map[fix_name(tid)] = fix_name(gid)
+        return gene_map
     with gzopen(gtf) as fh:
         for line in fh:
             line = line.strip()
@@ -66,13 +68,10 @@ def is_tid_mtg(tid):
 
 # extract transcript IDs
 has_truth = args.truth is not None
-truth_tids = set()
 tids = list()
 
 if has_truth:
-    with gzopen(args.truth) as fh:
-        for line in fh:
-            truth_tids.add(line.strip())
+    truth_tids = load_ids(args.truth)
 
     with gzopen(args.tids) as fh:
         for line in fh:
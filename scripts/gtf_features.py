@@ -1,5 +1,9 @@
 import argparse
-from statistics import mean, median, stdev
+from array import array
+from fileio import gzopen
+from gtf_index import load_gtf_index
+from interval_index import IntervalIndex
+from summary_stats import IntegerSummary
 
 # Written by Ka Ming Nip @kmnip
 
@@ -10,21 +14,12 @@ class FEATURE(str):
     GENE = 'gene'
 
 class MODE(str):
+    ALL = 'all'
     BED = 'bed'
     COUNT = 'count'
     LENGTH = 'length'
 
-def get_summary(lst):
-    lst.sort()
-    num = len(lst)
-    min_val = lst[0]
-    q1_val = lst[int(num/4)]
-    median_val = median(lst)
-    q3_val = lst[int(num*3/4)]
-    max_val = lst[-1]
-    mean_val = mean(lst)
-    stdev_val = stdev(lst)
-    return [min_val, q1_val, median_val, q3_val, max_val, mean_val, stdev_val]
+FEATURES = [FEATURE.EXON, FEATURE.INTRON, FEATURE.TRANSCRIPT, FEATURE.GENE]
 
 def get_tid_gid_from_attribute_col(col):
     tid = None
@@ -38,7 +33,11 @@ def get_tid_gid_from_attribute_col(col):
     return tid, gid
 
 def exon_generator(gtf):
-    with open(gtf) as fh:
+    gtf_idx = load_gtf_index(gtf)
+    if gtf_idx:
+        yield from gtf_idx.exons()
+        return
+    with gzopen(gtf) as fh:
         for line in fh:
             line = line.strip()
             if len(line) > 0 and line[0] != '#':
@@ -68,10 +67,10 @@ def extract_introns(exon_chain):
     return introns
 
 def extract_feature_lengths(gtf, summarize=False):
-    transcript_lengths = []
-    gene_lengths = []
-    exon_lengths = []
-    intron_lengths = []
+    transcript_lengths = IntegerSummary()
+    gene_lengths = IntegerSummary()
+    exon_lengths = IntegerSummary()
+    intron_lengths = IntegerSummary()
 
     if not summarize:
         print('name', 'feature', 'length', sep='\t')
@@ -91,7 +90,7 @@ def extract_feature_lengths(gtf, summarize=False):
         else:
             if prev_tid:
                 if summarize:
-                    transcript_lengths.append(txpt_len)
+                    transcript_lengths.add(txpt_len)
                 else:
                     print(prev_tid, FEATURE.TRANSCRIPT, str(txpt_len), sep='\t')
             introns.update(extract_introns(exon_chain))
@@ -104,11 +103,11 @@ def extract_feature_lengths(gtf, summarize=False):
         else:
             if prev_gid:
                 if summarize:
-                    gene_lengths.append(max_gid_end - min_gid_start + 1)
+                    gene_lengths.add(max_gid_end - min_gid_start + 1)
                     for _chrom, _start, _end, _strand, _gid in exons:
-                        exon_lengths.append(_end - _start + 1)
+                        exon_lengths.add(_end - _start + 1)
                     for _chrom, _start, _end, _strand, _gid in introns:
-                        intron_lengths.append(_end - _start + 1)
+                        intron_lengths.add(_end - _start + 1)
                 else:
                     print(prev_gid, FEATURE.GENE, str(max_gid_end - min_gid_start + 1), sep='\t')
                     for _chrom, _start, _end, _strand, _gid in sorted(exons):
@@ -131,37 +130,37 @@ def extract_feature_lengths(gtf, summarize=False):
     introns.update(extract_introns(exon_chain))
     if summarize:
         # process final record
-        transcript_lengths.append(txpt_len)
-        gene_lengths.append(max_gid_end - min_gid_start + 1)
+        transcript_lengths.add(txpt_len)
+        gene_lengths.add(max_gid_end - min_gid_start + 1)
         for _chrom, _start, _end, _strand, _gid in exons:
-            exon_lengths.append(_end - _start + 1)
+            exon_lengths.add(_end - _start + 1)
         for _chrom, _start, _end, _strand, _gid in introns:
-            intron_lengths.append(_end - _start + 1)
+            intron_lengths.add(_end - _start + 1)
         
         # print summary
         print('feature', 'n', 'min', 'q1', 'median', 'q3', 'max', 'mean', 'stdev', sep='\t')
         
         row = [FEATURE.TRANSCRIPT]
-        row.append(str(len(transcript_lengths)))
-        for val in get_summary(transcript_lengths):
+        row.append(str(transcript_lengths.n))
+        for val in transcript_lengths.get_summary():
             row.append(str(val))
         print('\t'.join(row))
         
         row = [FEATURE.GENE]
-        row.append(str(len(gene_lengths)))
-        for val in get_summary(gene_lengths):
+        row.append(str(gene_lengths.n))
+        for val in gene_lengths.get_summary():
             row.append(str(val))
         print('\t'.join(row))
         
         row = [FEATURE.EXON]
-        row.append(str(len(exon_lengths)))
-        for val in get_summary(exon_lengths):
+        row.append(str(exon_lengths.n))
+        for val in exon_lengths.get_summary():
             row.append(str(val))
         print('\t'.join(row))
         
         row = [FEATURE.INTRON]
-        row.append(str(len(intron_lengths)))
-        for val in get_summary(intron_lengths):
+        row.append(str(intron_lengths.n))
+        for val in intron_lengths.get_summary():
             row.append(str(val))
         print('\t'.join(row))
     else:
@@ -176,9 +175,9 @@ def extract_feature_lengths(gtf, summarize=False):
                 print(_chrom + ':' + str(_start) + '-' + str(_end) + ':' + _strand, FEATURE.INTRON, str(_end - _start + 1), sep='\t')
 
 def count_features_per_gene(gtf, summarize=False):
-    transcript_counts = []
-    exon_counts = []
-    intron_counts = []
+    transcript_counts = IntegerSummary()
+    exon_counts = IntegerSummary()
+    intron_counts = IntegerSummary()
     
     prev_gid = None
     prev_tid = None
@@ -197,13 +196,13 @@ def count_features_per_gene(gtf, summarize=False):
         if gid != prev_gid:
             if prev_gid:
                 if summarize:
-                    transcript_counts.append(len(transcripts))
-                    exon_counts.append(len(exons))
-                    intron_counts.append(len(introns))
+                    transcript_counts.add(len(transcripts))
+                    exon_counts.add(len(exons))
+                    intron_counts.add(len(introns))
                 else:
-                    print(gid, FEATURE.TRANSCRIPT, str(len(transcripts)))
-                    print(gid, FEATURE.EXON, str(len(exons)))
-                    print(gid, FEATURE.INTRON, str(len(introns)))
+                    print(prev_gid, FEATURE.TRANSCRIPT, str(len(transcripts)), sep='\t')
+                    print(prev_gid, FEATURE.EXON, str(len(exons)), sep='\t')
+                    print(prev_gid, FEATURE.INTRON, str(len(introns)), sep='\t')
             
             transcripts = set()
             exons = set()
@@ -220,37 +219,85 @@ def count_features_per_gene(gtf, summarize=False):
     if prev_gid:
         # process final record
         if summarize:
-            transcript_counts.append(len(transcripts))
-            exon_counts.append(len(exons))
-            intron_counts.append(len(introns))
+            transcript_counts.add(len(transcripts))
+            exon_counts.add(len(exons))
+            intron_counts.add(len(introns))
         else:
-            print(gid, FEATURE.TRANSCRIPT, str(len(transcripts)))
-            print(gid, FEATURE.EXON, str(len(exons)))
-            print(gid, FEATURE.INTRON, str(len(introns)))
+            print(prev_gid, FEATURE.TRANSCRIPT, str(len(transcripts)), sep='\t')
+            print(prev_gid, FEATURE.EXON, str(len(exons)), sep='\t')
+            print(prev_gid, FEATURE.INTRON, str(len(introns)), sep='\t')
 
     if summarize:
         # print summary
         print('feature', 'n', 'min', 'q1', 'median', 'q3', 'max', 'mean', 'stdev', sep='\t')
         row = [FEATURE.TRANSCRIPT]
-        row.append(str(sum(transcript_counts)))
-        for val in get_summary(transcript_counts):
+        row.append(str(transcript_counts.total))
+        for val in transcript_counts.get_summary():
             row.append(str(val))
         print('\t'.join(row))
         
         row = [FEATURE.EXON]
-        row.append(str(sum(exon_counts)))
-        for val in get_summary(exon_counts):
+        row.append(str(exon_counts.total))
+        for val in exon_counts.get_summary():
             row.append(str(val))
         print('\t'.join(row))
         
         row = [FEATURE.INTRON]
-        row.append(str(sum(intron_counts)))
-        for val in get_summary(intron_counts):
+        row.append(str(intron_counts.total))
+        for val in intron_counts.get_summary():
             row.append(str(val))
         print('\t'.join(row))
 
-def extract_bed3(gtf, feature):
+# index of the intervals of a feature, with the gene ID of exons and introns and
+# the transcript ID or gene ID of transcripts and genes as the values
+def get_feature_index(gtf, feature):
+    index = IntervalIndex()
     if feature == FEATURE.EXON:
+        exons = set()
+        for chrom, start, end, strand, tid, gid in exon_generator(gtf):
+            exons.add((chrom, start, end, strand, gid))
+        for chrom, start, end, strand, gid in exons:
+            index.add(chrom, start, end, strand, gid)
+
+    elif feature == FEATURE.INTRON:
+        prev_tid = None
+        introns = set()
+        exon_chain = list()
+        for chrom, start, end, strand, tid, gid in exon_generator(gtf):
+            if tid != prev_tid:
+                introns.update(extract_introns(exon_chain))
+                exon_chain = list()
+            prev_tid = tid
+            exon_chain.append((chrom, start, end, strand, gid))
+        introns.update(extract_introns(exon_chain))
+        for chrom, start, end, strand, gid in introns:
+            index.add(chrom, start, end, strand, gid)
+
+    elif feature == FEATURE.TRANSCRIPT or feature == FEATURE.GENE:
+        itv = dict()
+        for chrom, start, end, strand, tid, gid in exon_generator(gtf):
+            name = tid if feature == FEATURE.TRANSCRIPT else gid
+            if name in itv:
+                n_chrom, n_start, n_end, n_strand = itv[name]
+                assert n_chrom == chrom
+                itv[name] = (chrom, min(start, n_start), max(end, n_end), strand)
+            else:
+                itv[name] = (chrom, start, end, strand)
+        for name, (chrom, start, end, strand) in itv.items():
+            index.add(chrom, start, end, strand, name)
+
+    else:
+        raise ValueError('Unknown feature value ' + feature)
+
+    index.build()
+    return index
+
+def extract_bed3(gtf, feature, sort=False):
+    if sort:
+        for chrom, start, end, strand, name in get_feature_index(gtf, feature).intervals():
+            print(chrom, str(start), str(end), sep='\t')
+
+    elif feature == FEATURE.EXON:
         exons = set()
         for chrom, start, end, strand, tid, gid in exon_generator(gtf):
             exons.add((chrom, str(start), str(end), strand, gid))
@@ -298,35 +345,282 @@ def extract_bed3(gtf, feature):
     else:
         raise ValueError('Unknown feature value ' + feature)
 
-parser = argparse.ArgumentParser(description='Extract feature information from GTF file')
-subparsers = parser.add_subparsers(dest='mode')
-
-parser_bed_help = "Extract a BED3 file for the selected feature"
-parser_bed = subparsers.add_parser(MODE.BED,
-    description=parser_bed_help, help=parser_bed_help)
-parser_bed.add_argument('gtf', help='path of input GTF file')
-parser_bed.add_argument('--feature', help='feature of interest',
-    required=True,
-    choices=[FEATURE.EXON, FEATURE.INTRON, FEATURE.TRANSCRIPT, FEATURE.GENE])
-
-parser_count_help = "Count features per gene (i.e. exon, intron, transcript)"
-parser_count = subparsers.add_parser(MODE.COUNT,
-    description=parser_count_help, help=parser_count_help)
-parser_count.add_argument('gtf', help='path of input GTF file')
-parser_count.add_argument('--summary', action='store_true', help='print summary statistics')
-
-parser_length_help = "Extract feature lengths (i.e. exon, intron, transcript, gene)"
-parser_length = subparsers.add_parser(MODE.LENGTH,
-    description=parser_length_help, help=parser_length_help)
-parser_length.add_argument('gtf', help='path of input GTF file')
-parser_length.add_argument('--summary', action='store_true', help='print summary statistics')
-
-args = parser.parse_args()
-
-if args.mode == MODE.BED:
-    extract_bed3(args.gtf, args.feature)
-elif args.mode == MODE.LENGTH:
-    extract_feature_lengths(args.gtf, args.summary)
-elif args.mode == MODE.COUNT:
-    count_features_per_gene(args.gtf, args.summary)
+# Exons and introns are packed into single integers of their chromosome, start, end, strand
+# and gene codes, which are much smaller than tuples of strings in sets.
+COORD_BITS = 32
+CODE_BITS = 32
+STRAND_BITS = 8
+
+def pack_feature(chrom, start, end, strand, gid):
+    return ((((chrom << COORD_BITS | start) << COORD_BITS | end) << STRAND_BITS | strand) << CODE_BITS) | gid
+
+def unpack_feature(key):
+    gid = key & ((1 << CODE_BITS) - 1)
+    key >>= CODE_BITS
+    strand = key & ((1 << STRAND_BITS) - 1)
+    key >>= STRAND_BITS
+    end = key & ((1 << COORD_BITS) - 1)
+    key >>= COORD_BITS
+    start = key & ((1 << COORD_BITS) - 1)
+    return key >> COORD_BITS, start, end, strand, gid
+
+class Interner:
+    def __init__(self):
+        self.codes = dict()
+        self.names = list()
+    
+    def get(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+def write_summary_row(fw, feature, n, summary):
+    row = [feature, str(n)]
+    if summary.n > 0:
+        for val in summary.get_summary():
+            row.append(str(val))
+    fw.write('\t'.join(row) + '\n')
+
+# extract the outputs of all modes in a single pass over the exons;
+# the output files are identical to the outputs of the other modes
+def extract_all_features(gtf, outprefix):
+    chroms = Interner()
+    strands = Interner()
+    genes = Interner()
+    
+    def feature_sort_key(feature):
+        chrom, start, end, strand, gid = feature
+        return (chroms.names[chrom], start, end, strands.names[strand], genes.names[gid])
+    
+    def exon_bed_sort_key(feature):
+        # the exons of `bed` mode are sorted by their coordinates as strings
+        chrom, start, end, strand, gid = feature
+        return (chroms.names[chrom], str(start), str(end), strands.names[strand], genes.names[gid])
+    
+    def sort_gene_features(keys):
+        features = sorted(map(unpack_feature, keys))
+        if len(features) > 1 and (features[0][0] != features[-1][0] or len(set(f[3] for f in features)) > 1):
+            # the codes of multiple chromosomes or strands are not in order of their names
+            features.sort(key=feature_sort_key)
+        return features
+    
+    all_exons = set()
+    all_introns = set()
+    
+    # intervals in order of first appearance
+    tx_index = dict()
+    tx_chrom = array('i')
+    tx_start = array('q')
+    tx_end = array('q')
+    gene_chrom = array('i')
+    gene_start = array('q')
+    gene_end = array('q')
+    
+    transcript_lengths = IntegerSummary()
+    gene_lengths = IntegerSummary()
+    exon_lengths = IntegerSummary()
+    intron_lengths = IntegerSummary()
+    transcript_counts = IntegerSummary()
+    exon_counts = IntegerSummary()
+    intron_counts = IntegerSummary()
+    
+    # exon chain of the current transcript
+    chain_starts = array('q')
+    chain_ends = array('q')
+    chain_chrom = None
+    chain_strand = None
+    chain_gid = None
+    
+    # current gene
+    gene_exons = set()
+    gene_introns = set()
+    gene_tids = set()
+    
+    prev_gid = None
+    prev_tid = None
+    txpt_len = 0
+    min_gid_start = 0
+    max_gid_end = 0
+    
+    with open(outprefix + 'length.tsv', 'wt') as fw_len, \
+        open(outprefix + 'count.tsv', 'wt') as fw_count:
+        
+        fw_len.write('name\tfeature\tlength\n')
+        fw_count.write('gene_name\tfeature\tcount_per_gene\n')
+        
+        def add_chain_introns():
+            # introns between consecutive exons of the current transcript
+            exon_chain = sorted(zip(chain_starts, chain_ends))
+            for i in range(1, len(exon_chain)):
+                key = pack_feature(chain_chrom, exon_chain[i-1][1] + 1, exon_chain[i][0] - 1, chain_strand, chain_gid)
+                gene_introns.add(key)
+                all_introns.add(key)
+        
+        def flush_transcript():
+            fw_len.write(prev_tid + '\t' + FEATURE.TRANSCRIPT + '\t' + str(txpt_len) + '\n')
+            transcript_lengths.add(txpt_len)
+        
+        def flush_gene():
+            gene_len = max_gid_end - min_gid_start + 1
+            fw_len.write(prev_gid + '\t' + FEATURE.GENE + '\t' + str(gene_len) + '\n')
+            gene_lengths.add(gene_len)
+            for feature, keys, lengths in [(FEATURE.EXON, gene_exons, exon_lengths), (FEATURE.INTRON, gene_introns, intron_lengths)]:
+                for chrom, start, end, strand, gid in sort_gene_features(keys):
+                    fw_len.write(chroms.names[chrom] + ':' + str(start) + '-' + str(end) + ':' + strands.names[strand] +
+                                 '\t' + feature + '\t' + str(end - start + 1) + '\n')
+                    lengths.add(end - start + 1)
+            
+            fw_count.write(prev_gid + '\t' + FEATURE.TRANSCRIPT + '\t' + str(len(gene_tids)) + '\n')
+            fw_count.write(prev_gid + '\t' + FEATURE.EXON + '\t' + str(len(gene_exons)) + '\n')
+            fw_count.write(prev_gid + '\t' + FEATURE.INTRON + '\t' + str(len(gene_introns)) + '\n')
+            transcript_counts.add(len(gene_tids))
+            exon_counts.add(len(gene_exons))
+            intron_counts.add(len(gene_introns))
+        
+        for chrom_name, start, end, strand_name, tid, gid_name in exon_generator(gtf):
+            chrom = chroms.get(chrom_name)
+            strand = strands.get(strand_name)
+            gid = genes.get(gid_name)
+            
+            if tid == prev_tid:
+                txpt_len += end - start + 1
+            else:
+                if prev_tid:
+                    flush_transcript()
+                add_chain_introns()
+                del chain_starts[:]
+                del chain_ends[:]
+                chain_chrom = chrom
+                chain_strand = strand
+                chain_gid = gid
+                txpt_len = end - start + 1
+            
+            if gid_name == prev_gid:
+                min_gid_start = min(min_gid_start, start)
+                max_gid_end = max(max_gid_end, end)
+            else:
+                if prev_gid:
+                    flush_gene()
+                min_gid_start = start
+                max_gid_end = end
+                prev_gid = gid_name
+                gene_exons = set()
+                gene_introns = set()
+                gene_tids = set()
+            
+            key = pack_feature(chrom, start, end, strand, gid)
+            gene_exons.add(key)
+            all_exons.add(key)
+            gene_tids.add(tid)
+            
+            assert chrom == chain_chrom
+            assert strand == chain_strand
+            assert gid == chain_gid
+            chain_starts.append(start)
+            chain_ends.append(end)
+            
+            i = tx_index.get(tid)
+            if i is None:
+                tx_index[tid] = len(tx_chrom)
+                tx_chrom.append(chrom)
+                tx_start.append(start)
+                tx_end.append(end)
+            else:
+                assert tx_chrom[i] == chrom
+                tx_start[i] = min(tx_start[i], start)
+                tx_end[i] = max(tx_end[i], end)
+            
+            if gid == len(gene_chrom):
+                # first appearance of the gene
+                gene_chrom.append(chrom)
+                gene_start.append(start)
+                gene_end.append(end)
+            else:
+                assert gene_chrom[gid] == chrom
+                gene_start[gid] = min(gene_start[gid], start)
+                gene_end[gid] = max(gene_end[gid], end)
+            
+            prev_tid = tid
+        
+        # process final record
+        add_chain_introns()
+        if prev_tid:
+            flush_transcript()
+        if prev_gid:
+            flush_gene()
+    
+    with open(outprefix + FEATURE.EXON + '.bed', 'wt') as fw:
+        for chrom, start, end, strand, gid in sorted(map(unpack_feature, all_exons), key=exon_bed_sort_key):
+            fw.write(chroms.names[chrom] + '\t' + str(start) + '\t' + str(end) + '\n')
+    
+    with open(outprefix + FEATURE.INTRON + '.bed', 'wt') as fw:
+        for chrom, start, end, strand, gid in sorted(map(unpack_feature, all_introns), key=feature_sort_key):
+            fw.write(chroms.names[chrom] + '\t' + str(start) + '\t' + str(end) + '\n')
+    
+    with open(outprefix + FEATURE.TRANSCRIPT + '.bed', 'wt') as fw:
+        for chrom, start, end in zip(tx_chrom, tx_start, tx_end):
+            fw.write(chroms.names[chrom] + '\t' + str(start) + '\t' + str(end) + '\n')
+    
+    with open(outprefix + FEATURE.GENE + '.bed', 'wt') as fw:
+        for chrom, start, end in zip(gene_chrom, gene_start, gene_end):
+            fw.write(chroms.names[chrom] + '\t' + str(start) + '\t' + str(end) + '\n')
+    
+    with open(outprefix + 'length_summary.tsv', 'wt') as fw:
+        fw.write('feature\tn\tmin\tq1\tmedian\tq3\tmax\tmean\tstdev\n')
+        write_summary_row(fw, FEATURE.TRANSCRIPT, transcript_lengths.n, transcript_lengths)
+        write_summary_row(fw, FEATURE.GENE, gene_lengths.n, gene_lengths)
+        write_summary_row(fw, FEATURE.EXON, exon_lengths.n, exon_lengths)
+        write_summary_row(fw, FEATURE.INTRON, intron_lengths.n, intron_lengths)
+    
+    with open(outprefix + 'count_summary.tsv', 'wt') as fw:
+        fw.write('feature\tn\tmin\tq1\tmedian\tq3\tmax\tmean\tstdev\n')
+        write_summary_row(fw, FEATURE.TRANSCRIPT, transcript_counts.total, transcript_counts)
+        write_summary_row(fw, FEATURE.EXON, exon_counts.total, exon_counts)
+        write_summary_row(fw, FEATURE.INTRON, intron_counts.total, intron_counts)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract feature information from GTF file')
+    subparsers = parser.add_subparsers(dest='mode')
+
+    parser_bed_help = "Extract a BED3 file for the selected feature"
+    parser_bed = subparsers.add_parser(MODE.BED,
+        description=parser_bed_help, help=parser_bed_help)
+    parser_bed.add_argument('gtf', help='path of input GTF file')
+    parser_bed.add_argument('--feature', help='feature of interest',
+        required=True,
+        choices=FEATURES)
+    parser_bed.add_argument('--sort', action='store_true',
+        help='sort the intervals by chromosome, start and end')
+
+    parser_count_help = "Count features per gene (i.e. exon, intron, transcript)"
+    parser_count = subparsers.add_parser(MODE.COUNT,
+        description=parser_count_help, help=parser_count_help)
+    parser_count.add_argument('gtf', help='path of input GTF file')
+    parser_count.add_argument('--summary', action='store_true', help='print summary statistics')
+
+    parser_length_help = "Extract feature lengths (i.e. exon, intron, transcript, gene)"
+    parser_length = subparsers.add_parser(MODE.LENGTH,
+        description=parser_length_help, help=parser_length_help)
+    parser_length.add_argument('gtf', help='path of input GTF file')
+    parser_length.add_argument('--summary', action='store_true', help='print summary statistics')
+
+    parser_all_help = "Extract the outputs of all modules in a single pass"
+    parser_all = subparsers.add_parser(MODE.ALL,
+        description=parser_all_help, help=parser_all_help)
+    parser_all.add_argument('gtf', help='path of input GTF file')
+    parser_all.add_argument('outprefix', help='path prefix of output files')
+
+    args = parser.parse_args()
+
+    if args.mode == MODE.ALL:
+        extract_all_features(args.gtf, args.outprefix)
+    elif args.mode == MODE.BED:
+        extract_bed3(args.gtf, args.feature, args.sort)
+    elif args.mode == MODE.LENGTH:
+        extract_feature_lengths(args.gtf, args.summary)
+    elif args.mode == MODE.COUNT:
+        count_features_per_gene(args.gtf, args.summary)
 
@@ -1,46 +1,156 @@
 import argparse
+import multiprocessing
+import sys
+from collections import deque
+from fileio import gzopen
+from gtf_index import FILTER_FEATURES, LINE_KEEP, LINE_DROP, load_gtf_index
+from id_index import is_id_index, load_ids
 
 # Written by Ka Ming Nip @kmnip
 
+# size of the line-aligned chunks of the GTF file filtered at a time
+CHUNK_SIZE = 16 << 20
+
+TID_KEY = b'transcript_id "'
+FEATURES = set(feature.encode() for feature in FILTER_FEATURES)
+
 def get_tid_from_attribute_col(col, fix_id):
     for info in col.split(';'):
-        key, val = info.strip().split()
+        key, _, val = info.strip().partition(' ')
         if key == 'transcript_id':
-            tid = val.strip('"')
+            tid = val.strip().strip('"')
             if fix_id:
                 tid = tid.split('.')[0]
             return tid
     return None
-    
-parser = argparse.ArgumentParser(description='Filter a GTF file based on a list of transcript IDs')
-parser.add_argument('gtf', help='path of input GTF file')
-parser.add_argument('tids', help='path of transcript ID list file')
-parser.add_argument('--fix', action='store_true', help='fix transcript IDs by removing `.` and trailing characters')
-args = parser.parse_args()
-
-fix_id = args.fix
-tids_set = set()
-with open(args.tids) as fh:
-    if fix_id:
-        for line in fh:
-            tids_set.add(line.strip().split('.')[0])
-    else:
-        for line in fh:
-            tids_set.add(line.strip())
 
-with open(args.gtf) as fh:
-    features = ['exon', 'transcript', 'start_codon', 'stop_codon', 'CDS', 'UTR']
+# byte-level search for the `transcript_id` attribute in the attribute column of a GTF line
+def get_tid_from_attribute_bytes(col, fix_id):
+    i = col.find(TID_KEY)
+    while i > 0 and col[i-1] not in b' \t;':
+        # key ending in `transcript_id`, e.g. `original_transcript_id`
+        i = col.find(TID_KEY, i + 1)
+    if i >= 0:
+        start = i + len(TID_KEY)
+        end = col.find(b'"', start)
+    if i < 0 or end < 0:
+        if b'transcript_id' in col:
+            # unquoted value or missing closing quote
+            tid = get_tid_from_attribute_col(col.decode(), fix_id)
+            return tid.encode() if tid else None
+        return None
+    tid = col[start:end]
+    if fix_id:
+        tid = tid.split(b'.')[0]
+    return tid
 
-    for line in fh:
+def filter_chunk(chunk):
+    global tids_set, fix_id
+    kept = list()
+    for line in chunk.splitlines():
         line = line.strip()
-        if len(line.strip()) > 0 and line[0] != '#':
-            cols = line.split('\t')
-            if cols[2] in features :
-                tid = get_tid_from_attribute_col(cols[8], fix_id)
+        if len(line) > 0 and line[0] != 35: # '#'
+            cols = line.split(b'\t', 8)
+            if cols[2] in FEATURES:
+                tid = get_tid_from_attribute_bytes(cols[8], fix_id)
                 if tid and tid in tids_set:
-                    print(line)
+                    kept.append(line)
             else:
-                print(line)
+                kept.append(line)
         else:
-            print(line)
+            kept.append(line)
+    if kept:
+        kept.append(b'')
+    return b'\n'.join(kept)
+
+def read_chunks(fh, size):
+    while True:
+        chunk = fh.read(size)
+        if not chunk:
+            break
+        # extend the chunk to the end of the line
+        yield chunk + fh.readline()
 
+def imap_ordered(pool, func, iterable, max_pending):
+    # like `pool.imap`, but do not consume `iterable` faster than results are collected
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Filter a GTF file based on a list of transcript IDs')
+    parser.add_argument('gtf', help='path of input GTF file')
+    parser.add_argument('tids', help='path of transcript ID list file or its index built by `id_index.py`')
+    parser.add_argument('--fix', action='store_true', help='fix transcript IDs by removing `.` and trailing characters')
+    parser.add_argument('--output', dest='output', metavar='PATH', type=str,
+                        help='path of output GTF file; gzip\'d if it ends with `.gz` (default: stdout)')
+    parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                        help='number of threads for decompressing the GTF file and worker processes for filtering it (default: %(default)s)')
+    args = parser.parse_args()
+
+    fix_id = args.fix
+    if is_id_index(args.tids):
+        # the IDs are looked up in the memory-mapped index
+        try:
+            tids_set = load_ids(args.tids, fix_id)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        tids_set = set()
+        with gzopen(args.tids, 'rb') as fh:
+            if fix_id:
+                for line in fh:
+                    tids_set.add(line.strip().split(b'.')[0])
+            else:
+                for line in fh:
+                    tids_set.add(line.strip())
+
+    gtf_idx = load_gtf_index(args.gtf)
+
+    pool = None
+    if not gtf_idx and args.threads > 1:
+        # worker processes are forked before the input and output files are opened so that they
+        # inherit neither decompression threads nor pipes
+        pool = multiprocessing.get_context('fork').Pool(args.threads)
+
+    fw = gzopen(args.output, 'wb') if args.output else sys.stdout.buffer
+
+    if gtf_idx:
+        # look up the transcript of each line in the index instead of parsing its attributes
+        if fix_id:
+            keep_tx = list(tid.split('.')[0].encode() in tids_set for tid in gtf_idx.tx_names)
+        else:
+            keep_tx = list(tid.encode() in tids_set for tid in gtf_idx.tx_names)
+
+        with gzopen(args.gtf, 'rb', threads=args.threads) as fh:
+            kept = list()
+            for line, tx in zip(fh, gtf_idx.line_tx):
+                if tx == LINE_KEEP or (tx != LINE_DROP and keep_tx[tx]):
+                    kept.append(line.strip())
+                    if len(kept) >= 1 << 16:
+                        kept.append(b'')
+                        fw.write(b'\n'.join(kept))
+                        kept = list()
+            if kept:
+                kept.append(b'')
+                fw.write(b'\n'.join(kept))
+    else:
+        with gzopen(args.gtf, 'rb', threads=args.threads) as fh:
+            chunks = read_chunks(fh, CHUNK_SIZE)
+            if pool:
+                # the chunks are filtered in parallel and written in order
+                with pool:
+                    for filtered in imap_ordered(pool, filter_chunk, chunks, 2 * args.threads):
+                        fw.write(filtered)
+            else:
+                for chunk in chunks:
+                    fw.write(filter_chunk(chunk))
+
+    if args.output:
+        fw.close()
+    else:
+        fw.flush()
@@ -0,0 +1,211 @@
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from fileio import gzopen
+
+# A compact binary index of a GTF file that can be memory-mapped by the GTF-consuming scripts.
+#
+# layout (little-endian):
+#   magic
+#   key of the indexed GTF: file size, modification time (ns), CRC32 of its head and tail
+#   sections, each as: typecode (1 byte), number of items (8 bytes), data (padded to 8 bytes)
+#
+# Transcripts are interned in order of their first appearance in the GTF, genes in order of their
+# first appearance in `transcript`/`exon` lines. Exons are stored in file order.
+
+MAGIC = b'GTFIDX01'
+SUFFIX = '.gtfidx'
+KEY_FORMAT = '<QQI'
+SECTION_FORMAT = '<cQ'
+SAMPLE_SIZE = 1 << 20
+
+# features considered by `gtf_filter.py`
+FILTER_FEATURES = {'exon', 'transcript', 'start_codon', 'stop_codon', 'CDS', 'UTR'}
+
+# `line_tx` codes for lines without a transcript
+LINE_KEEP = -1 # comment line, empty line, or feature not considered by `gtf_filter.py`
+LINE_DROP = -2 # feature considered by `gtf_filter.py` but without `transcript_id`
+
+SECTIONS = ['chrom_names', 'gene_names', 'tx_names',
+            'tx_gene', 'tx_chrom', 'tx_strand',
+            'exon_tx', 'exon_start', 'exon_end',
+            'line_tx']
+
+def get_index_path(gtf):
+    return gtf + SUFFIX
+
+def get_gtf_key(gtf):
+    st = os.stat(gtf)
+    crc = 0
+    with open(gtf, 'rb') as fh:
+        crc = zlib.crc32(fh.read(SAMPLE_SIZE), crc)
+        if st.st_size > SAMPLE_SIZE:
+            fh.seek(max(SAMPLE_SIZE, st.st_size - SAMPLE_SIZE))
+            crc = zlib.crc32(fh.read(SAMPLE_SIZE), crc)
+    return (st.st_size, st.st_mtime_ns, crc)
+
+def get_tid_gid_from_attribute_col(col):
+    tid = None
+    gid = None
+    for info in col.split(';'):
+        info = info.strip()
+        if info:
+            key, _, val = info.partition(' ')
+            if key == 'transcript_id':
+                tid = val.strip().strip('"')
+            elif key == 'gene_id':
+                gid = val.strip().strip('"')
+            if tid and gid:
+                break
+    return tid, gid
+
+def build_gtf_index(gtf):
+    index_path = get_index_path(gtf)
+    key = get_gtf_key(gtf)
+
+    chrom_codes = dict()
+    gene_codes = dict()
+    tx_codes = dict()
+
+    tx_gene = array('i')
+    tx_chrom = array('i')
+    tx_strand = array('B')
+    exon_tx = array('i')
+    exon_start = array('i')
+    exon_end = array('i')
+    line_tx = array('i')
+
+    with gzopen(gtf) as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line) == 0 or line[0] == '#':
+                line_tx.append(LINE_KEEP)
+                continue
+
+            cols = line.split('\t')
+            feature = cols[2]
+            if feature not in FILTER_FEATURES:
+                line_tx.append(LINE_KEEP)
+                continue
+
+            tid, gid = get_tid_gid_from_attribute_col(cols[8])
+            if not tid:
+                line_tx.append(LINE_DROP)
+                continue
+
+            tx = tx_codes.get(tid)
+            if tx is None:
+                tx = len(tx_codes)
+                tx_codes[tid] = tx
+                chrom = chrom_codes.setdefault(cols[0], len(chrom_codes))
+                tx_gene.append(-1)
+                tx_chrom.append(chrom)
+                tx_strand.append(ord(cols[6]))
+            line_tx.append(tx)
+
+            if (feature == 'transcript' or feature == 'exon') and gid:
+                tx_gene[tx] = gene_codes.setdefault(gid, len(gene_codes))
+                if feature == 'exon':
+                    exon_tx.append(tx)
+                    exon_start.append(int(cols[3]))
+                    exon_end.append(int(cols[4]))
+
+    sections = {
+        'chrom_names': array('B', '\n'.join(chrom_codes).encode()),
+        'gene_names': array('B', '\n'.join(gene_codes).encode()),
+        'tx_names': array('B', '\n'.join(tx_codes).encode()),
+        'tx_gene': tx_gene,
+        'tx_chrom': tx_chrom,
+        'tx_strand': tx_strand,
+        'exon_tx': exon_tx,
+        'exon_start': exon_start,
+        'exon_end': exon_end,
+        'line_tx': line_tx,
+    }
+
+    # write to a temporary file first so that a partial index is never loaded
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as fw:
+        fw.write(MAGIC)
+        fw.write(struct.pack(KEY_FORMAT, *key))
+        for name in SECTIONS:
+            arr = sections[name]
+            fw.write(struct.pack(SECTION_FORMAT, arr.typecode.encode(), len(arr)))
+            pad = -fw.tell() % 8
+            fw.write(b'\0' * pad)
+            arr.tofile(fw)
+            pad = -fw.tell() % 8
+            fw.write(b'\0' * pad)
+    os.replace(tmp_path, index_path)
+
+    return index_path
+
+class GtfIndex:
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mm)
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a GTF index file ' + index_path)
+        pos = len(MAGIC)
+        self.key = struct.unpack_from(KEY_FORMAT, buf, pos)
+        pos += struct.calcsize(KEY_FORMAT)
+
+        for name in SECTIONS:
+            typecode, length = struct.unpack_from(SECTION_FORMAT, buf, pos)
+            pos += struct.calcsize(SECTION_FORMAT)
+            pos += -pos % 8
+            typecode = typecode.decode()
+            nbytes = length * array(typecode).itemsize
+            setattr(self, name, buf[pos:pos+nbytes].cast(typecode))
+            pos += nbytes
+            pos += -pos % 8
+
+        self.chrom_names = self._split_names(self.chrom_names)
+        self.gene_names = self._split_names(self.gene_names)
+        self.tx_names = self._split_names(self.tx_names)
+
+    @staticmethod
+    def _split_names(blob):
+        if len(blob) == 0:
+            return []
+        return bytes(blob).decode().split('\n')
+
+    # iterate (transcript ID, gene ID) pairs in order of first appearance of the transcripts
+    def transcript_genes(self):
+        gene_names = self.gene_names
+        for tid, gene in zip(self.tx_names, self.tx_gene):
+            if gene >= 0:
+                yield tid, gene_names[gene]
+
+    # iterate exons in file order as (chrom, start, end, strand, tid, gid)
+    def exons(self):
+        chrom_names = self.chrom_names
+        gene_names = self.gene_names
+        tx_names = self.tx_names
+        tx_gene = self.tx_gene
+        tx_chrom = self.tx_chrom
+        tx_strand = self.tx_strand
+        for tx, start, end in zip(self.exon_tx, self.exon_start, self.exon_end):
+            yield (chrom_names[tx_chrom[tx]], start, end, chr(tx_strand[tx]), tx_names[tx], gene_names[tx_gene[tx]])
+
+# load the index of a GTF file if it exists and is up-to-date
+def load_gtf_index(gtf):
+    index_path = get_index_path(gtf)
+    if not os.path.isfile(index_path):
+        return None
+    gtf_idx = GtfIndex(index_path)
+    if gtf_idx.key != get_gtf_key(gtf):
+        return None
+    return gtf_idx
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a binary index of a GTF file')
+    parser.add_argument('gtf', help='path of input GTF file; the index is written to this path + `' + SUFFIX + '`')
+    args = parser.parse_args()
+
+    build_gtf_index(args.gtf)
@@ -1,6 +1,8 @@
 import argparse
-from statistics import mean, median, stdev
 from operator import itemgetter
+from fileio import gzopen
+from gtf_index import load_gtf_index
+from summary_stats import IntegerSummary
 
 # Written by Ka Ming Nip @kmnip
 
@@ -24,39 +26,40 @@ args = parser.parse_args()
 
 # store a set of `transcript_id` for each `gene_id`
 gid_tids_dict = dict()
-with open(args.gtf) as fh:
-    for line in fh:
-        line = line.strip()
-        if len(line.strip()) > 0 and line[0] != '#':
-            cols = line.split('\t')
-            if cols[2] == 'exon' or cols[2] == 'transcript':                
-                gid, tid = get_gid_tid_from_attribute_col(cols[8])
-                if gid and tid:
-                    if gid in gid_tids_dict:
-                        gid_tids_dict[gid].add(tid)
-                    else:
-                        tids = set()
-                        tids.add(tid)
-                        gid_tids_dict[gid] = tids
+gtf_idx = load_gtf_index(args.gtf)
+if gtf_idx:
+    # genes are stored in order of their first appearance
+    for gid in gtf_idx.gene_names:
+        gid_tids_dict[gid] = set()
+    for tid, gid in gtf_idx.transcript_genes():
+        gid_tids_dict[gid].add(tid)
+else:
+    with gzopen(args.gtf) as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line.strip()) > 0 and line[0] != '#':
+                cols = line.split('\t')
+                if cols[2] == 'exon' or cols[2] == 'transcript':                
+                    gid, tid = get_gid_tid_from_attribute_col(cols[8])
+                    if gid and tid:
+                        if gid in gid_tids_dict:
+                            gid_tids_dict[gid].add(tid)
+                        else:
+                            tids = set()
+                            tids.add(tid)
+                            gid_tids_dict[gid] = tids
 
 # count the number of isoforms for each gene
 gid_counts = list((gid, len(tids)) for gid, tids in gid_tids_dict.items())
 
 if args.summary:
-    counts = list(c for gid, c in gid_counts)
-    counts.sort()
-    
-    num_genes = len(counts)
-    num_isoforms = sum(counts)
+    counts = IntegerSummary()
+    counts.update(c for gid, c in gid_counts)
     
-    min_count = counts[0]
-    q1_count = counts[int(num_genes/4)]
-    median_count = median(counts)
-    q3_count = counts[int(num_genes*3/4)]
-    max_count = counts[-1]
+    num_genes = counts.n
+    num_isoforms = counts.total
     
-    mean_count = mean(counts)
-    stdev_count = stdev(counts) 
+    min_count, q1_count, median_count, q3_count, max_count, mean_count, stdev_count = counts.get_summary()
     
     print('genes:   ', str(num_genes), sep='\t')
     print('isoforms:', str(num_isoforms), sep='\t')
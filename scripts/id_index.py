@@ -0,0 +1,182 @@
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from fileio import gzopen
+
+# A compact binary index of a list of IDs (e.g. truth transcript IDs) that can be memory-mapped
+# by the scripts that filter by the list.
+#
+# layout (little-endian):
+#   magic
+#   flags: whether versions (`.` and trailing characters) were removed from the IDs
+#   sections, each as: typecode (1 byte), number of items (8 bytes), data (padded to 8 bytes)
+#
+# The unique IDs are stored sorted and concatenated, with the offset of each ID. The hash table
+# is an open-addressing table of the CRC32 of the IDs with linear probing; each slot holds the
+# rank of an ID or -1. Membership tests read the IDs from the memory map, so the IDs are never
+# loaded into the heap.
+
+MAGIC = b'IDSIDX01'
+SUFFIX = '.ididx'
+FLAGS_FORMAT = '<Q'
+SECTION_FORMAT = '<cQ'
+
+FLAG_FIXED = 1
+
+SECTIONS = ['ids', 'id_offsets', 'slots']
+
+def get_index_path(ids_file):
+    return ids_file + SUFFIX
+
+def is_id_index(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+def get_num_slots(num_ids):
+    # power of 2 for a load factor of at most 0.5
+    num_slots = 1
+    while num_slots < 2 * num_ids:
+        num_slots <<= 1
+    return num_slots
+
+def build_id_index(ids_file, index_path=None, fix_id=False):
+    if index_path is None:
+        index_path = get_index_path(ids_file)
+
+    ids = set()
+    with gzopen(ids_file, 'rb') as fh:
+        for line in fh:
+            i = line.strip()
+            if fix_id:
+                i = i.split(b'.')[0]
+            if i:
+                ids.add(i)
+
+    return write_id_index(ids, index_path, fix_id)
+
+# write the index of the IDs (as `bytes`) in `ids`
+def write_id_index(ids, index_path, fix_id=False):
+    ids = sorted(ids)
+
+    id_offsets = array('Q', [0])
+    for i in ids:
+        id_offsets.append(id_offsets[-1] + len(i))
+
+    num_slots = get_num_slots(len(ids))
+    mask = num_slots - 1
+    slots = array('i', [-1]) * num_slots
+    for rank, i in enumerate(ids):
+        slot = zlib.crc32(i) & mask
+        while slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        slots[slot] = rank
+
+    sections = {
+        'ids': array('B', b''.join(ids)),
+        'id_offsets': id_offsets,
+        'slots': slots,
+    }
+
+    # write to a temporary file first so that a partial index is never loaded
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as fw:
+        fw.write(MAGIC)
+        fw.write(struct.pack(FLAGS_FORMAT, FLAG_FIXED if fix_id else 0))
+        for name in SECTIONS:
+            arr = sections[name]
+            fw.write(struct.pack(SECTION_FORMAT, arr.typecode.encode(), len(arr)))
+            pad = -fw.tell() % 8
+            fw.write(b'\0' * pad)
+            arr.tofile(fw)
+            pad = -fw.tell() % 8
+            fw.write(b'\0' * pad)
+    os.replace(tmp_path, index_path)
+
+    return index_path
+
+# a set-like view of the IDs; IDs can be tested as `str` or `bytes` and are iterated as `str`
+class IdIndex:
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mm)
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not an ID index file ' + index_path)
+        pos = len(MAGIC)
+        flags, = struct.unpack_from(FLAGS_FORMAT, buf, pos)
+        self.fixed = bool(flags & FLAG_FIXED)
+        pos += struct.calcsize(FLAGS_FORMAT)
+
+        for name in SECTIONS:
+            typecode, length = struct.unpack_from(SECTION_FORMAT, buf, pos)
+            pos += struct.calcsize(SECTION_FORMAT)
+            pos += -pos % 8
+            typecode = typecode.decode()
+            nbytes = length * array(typecode).itemsize
+            setattr(self, name, buf[pos:pos+nbytes].cast(typecode))
+            pos += nbytes
+            pos += -pos % 8
+
+        self._mask = len(self.slots) - 1
+
+    def __len__(self):
+        return len(self.id_offsets) - 1
+
+    def __contains__(self, i):
+        if isinstance(i, str):
+            i = i.encode()
+        ids = self.ids
+        id_offsets = self.id_offsets
+        slots = self.slots
+        mask = self._mask
+        slot = zlib.crc32(i) & mask
+        rank = slots[slot]
+        while rank >= 0:
+            start = id_offsets[rank]
+            end = id_offsets[rank+1]
+            if end - start == len(i) and ids[start:end] == i:
+                return True
+            slot = (slot + 1) & mask
+            rank = slots[slot]
+        return False
+
+    # iterate the IDs in sorted order
+    def __iter__(self):
+        ids = self.ids
+        id_offsets = self.id_offsets
+        for rank in range(len(self)):
+            yield bytes(ids[id_offsets[rank]:id_offsets[rank+1]]).decode()
+
+# load a list of IDs as a set, or as an `IdIndex` if the file is an ID index
+def load_ids(path, fix_id=False):
+    if is_id_index(path):
+        id_idx = IdIndex(path)
+        if fix_id and not id_idx.fixed:
+            raise ValueError('ID index ' + path + ' was built without `--fix`')
+        return id_idx
+
+    ids = set()
+    with gzopen(path) as fh:
+        if fix_id:
+            for line in fh:
+                ids.add(line.strip().split('.')[0])
+        else:
+            for line in fh:
+                ids.add(line.strip())
+    return ids
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a binary index of a list of IDs')
+    parser.add_argument('ids', help='path of input ID list file (one ID per line)')
+    parser.add_argument('--output', dest='output', metavar='PATH', type=str,
+                        help='path of output index (default: input path + `' + SUFFIX + '`)')
+    parser.add_argument('--fix', action='store_true', help='fix IDs by removing `.` and trailing characters')
+    args = parser.parse_args()
+
+    build_id_index(args.ids, args.output, args.fix)
@@ -0,0 +1,169 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+# An in-memory index of genomic intervals (e.g. the exons from `gtf_features.exon_generator`) for
+# overlap and nearest queries without temporary files or `bedtools`.
+#
+# Intervals are closed and 1-based, as in GTF files; add 1 to the start of BED intervals. They are
+# grouped by chromosome and strand, and each group is stored as a nested containment list (NCList):
+# the intervals that are not contained in another one form the top-level list, and the intervals
+# contained in each interval form its sublist, recursively. No interval of a list contains another,
+# so both the starts and the ends of a list are increasing. An overlap query bisects the ends of a
+# list and walks forward only over overlapping intervals, descending into their sublists, so long
+# intervals such as genes do not slow down the queries of the short intervals that follow them.
+
+class IntervalIndex:
+    def __init__(self):
+        self._pending = dict()
+        self._groups = dict()
+
+    # `value` is returned by the queries, e.g. a transcript ID
+    def add(self, chrom, start, end, strand='.', value=None):
+        key = (chrom, strand)
+        intervals = self._pending.get(key)
+        if intervals is None:
+            intervals = list()
+            self._pending[key] = intervals
+        intervals.append((start, end, value))
+
+    # build the nested containment lists; must be called before any query
+    def build(self):
+        for key, intervals in self._pending.items():
+            if key in self._groups:
+                intervals.extend(zip(*self._groups[key][:3]))
+            # containing intervals come before the intervals they contain
+            intervals.sort(key=lambda itv: (itv[0], -itv[1]))
+
+            # parent of each interval, i.e. the smallest interval containing it, or -1
+            parents = list()
+            stack = list()
+            for k, (start, end, value) in enumerate(intervals):
+                while stack and intervals[stack[-1]][1] < end:
+                    stack.pop()
+                parents.append(stack[-1] if stack else -1)
+                stack.append(k)
+
+            # lay out each list contiguously, the top-level list first, in order of start
+            sublists = dict()
+            for k, parent in enumerate(parents):
+                sublists.setdefault(parent, list()).append(k)
+            order = list()
+            pos = dict()
+            queue = [-1]
+            for parent in queue:
+                members = sublists.get(parent)
+                if members:
+                    pos[parent] = (len(order), len(order) + len(members))
+                    order.extend(members)
+                    queue.extend(members)
+
+            starts = array('l', (intervals[k][0] for k in order))
+            ends = array('l', (intervals[k][1] for k in order))
+            values = [intervals[k][2] for k in order]
+            # range of the sublist of each interval in the arrays; empty if it contains no interval
+            sub_starts = array('l', (pos.get(k, (0, 0))[0] for k in order))
+            sub_ends = array('l', (pos.get(k, (0, 0))[1] for k in order))
+            self._groups[key] = (starts, ends, values, sub_starts, sub_ends, pos[-1][1])
+        self._pending = dict()
+
+    def __len__(self):
+        return sum(len(group[0]) for group in self._groups.values())
+
+    def _get_groups(self, chrom, strand):
+        if strand is None:
+            return [group for (c, s), group in self._groups.items() if c == chrom]
+        group = self._groups.get((chrom, strand))
+        return [group] if group else []
+
+    # iterate all intervals as (chrom, start, end, strand, value) sorted by chromosome, start and end
+    def intervals(self):
+        groups = list()
+        for (chrom, strand), (starts, ends, values, sub_starts, sub_ends, top_end) in self._groups.items():
+            groups.extend(zip(starts, ends, [strand] * len(starts), values, [chrom] * len(starts)))
+        groups.sort(key=lambda itv: (itv[4], itv[0], itv[1], itv[2]))
+        for start, end, strand, value, chrom in groups:
+            yield chrom, start, end, strand, value
+
+    # indexes of the intervals of a group overlapping [start, end]
+    @staticmethod
+    def _overlap_idxs(group, start, end):
+        starts, ends, values, sub_starts, sub_ends, top_end = group
+        lists = [(0, top_end)]
+        while lists:
+            lo, hi = lists.pop()
+            # the first interval of the list ending at or after the query start
+            i = bisect_left(ends, start, lo, hi)
+            while i < hi and starts[i] <= end:
+                yield i
+                if sub_starts[i] < sub_ends[i]:
+                    lists.append((sub_starts[i], sub_ends[i]))
+                i += 1
+
+    # values of the intervals overlapping [start, end] on either strand if `strand` is None
+    def overlap(self, chrom, start, end, strand=None):
+        found = list()
+        for group in self._get_groups(chrom, strand):
+            values = group[2]
+            for i in self._overlap_idxs(group, start, end):
+                found.append(values[i])
+        return found
+
+    # whether any interval overlaps [start, end]
+    def overlaps(self, chrom, start, end, strand=None):
+        for starts, ends, values, sub_starts, sub_ends, top_end in self._get_groups(chrom, strand):
+            # an interval overlapping the query is contained in a top-level interval that overlaps it
+            i = bisect_left(ends, start, 0, top_end)
+            if i < top_end and starts[i] <= end:
+                return True
+        return False
+
+    # (distance, value) of the nearest interval to [start, end], with distance 0 for overlaps;
+    # None if there is no interval on the chromosome
+    def nearest(self, chrom, start, end, strand=None):
+        best = None
+        for starts, ends, values, sub_starts, sub_ends, top_end in self._get_groups(chrom, strand):
+            # all intervals are contained in the top-level ones, whose ends are increasing
+            n = bisect_right(starts, end, 0, top_end)
+            # the top-level interval with the largest end among those starting before the query end
+            i = n - 1
+            if i >= 0:
+                dist = max(0, start - ends[i])
+                if best is None or dist < best[0]:
+                    best = (dist, values[i])
+            # first top-level interval starting after the query; a contained interval starting
+            # before it is inside an interval overlapping the query
+            if n < top_end:
+                dist = starts[n] - end
+                if best is None or dist < best[0]:
+                    best = (dist, values[n])
+        return best
+
+    # overlaps of many queries of (chrom, start, end, strand) in one call; the queries are
+    # answered in sorted order so that consecutive queries reuse the same groups
+    def overlap_batch(self, queries):
+        queries = list(queries)
+        results = [None] * len(queries)
+        order = sorted(range(len(queries)), key=lambda k: (queries[k][0], queries[k][3] or '', queries[k][1]))
+        prev_key = None
+        groups = None
+        for k in order:
+            chrom, start, end, strand = queries[k]
+            if (chrom, strand) != prev_key:
+                groups = self._get_groups(chrom, strand)
+                prev_key = (chrom, strand)
+            found = list()
+            for group in groups:
+                values = group[2]
+                for i in self._overlap_idxs(group, start, end):
+                    found.append(values[i])
+            results[k] = found
+        return results
+
+    # number of intervals containing each of the sorted `positions` on a chromosome
+    def count_points(self, chrom, positions, strand=None):
+        counts = [0] * len(positions)
+        for group in self._get_groups(chrom, strand):
+            for k, pos in enumerate(positions):
+                for i in self._overlap_idxs(group, pos, pos):
+                    counts[k] += 1
+        return counts
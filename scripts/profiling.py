@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import timedelta
+
+# Instrumentation of the phases of a script: wall time, CPU time, peak RSS and throughput.
+#
+# CPU time of the script includes its threads. CPU time and peak RSS of child processes
+# (e.g. worker processes and decompression commands) are only reported by the operating
+# system once they have exited, so they are attributed to the phase in which they are joined.
+
+def get_cpu_times():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime,
+            child_usage.ru_utime + child_usage.ru_stime)
+
+def get_max_rss_kb():
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def format_size(num_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return '%.1f %s' % (num_bytes, unit)
+        num_bytes /= 1024
+    return '%.1f TB' % num_bytes
+
+# phases are logged when they stop if `log_phases` is set
+class PhaseTimer:
+    def __init__(self, log_phases=False):
+        self.log_phases = log_phases
+        self.phases = list()
+        self._name = None
+        self._start = time.perf_counter()
+        self._phase_start = None
+
+    def start(self, name):
+        if self._name:
+            self.stop()
+        self._name = name
+        self._phase_start = (time.perf_counter(), get_cpu_times())
+
+    # stop the current phase; `records` maps units (e.g. `lines`) to the number processed
+    def stop(self, **records):
+        wall_start, (cpu_start, child_cpu_start) = self._phase_start
+        wall = time.perf_counter() - wall_start
+        cpu, child_cpu = get_cpu_times()
+        max_rss, child_max_rss = get_max_rss_kb()
+        phase = {
+            'name': self._name,
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu - cpu_start, 4),
+            'children_cpu_s': round(child_cpu - child_cpu_start, 4),
+            'max_rss_kb': max_rss,
+            'children_max_rss_kb': child_max_rss,
+        }
+        for unit, num in records.items():
+            phase[unit] = num
+            phase[unit + '_per_s'] = round(num / wall, 1) if wall > 0 else None
+        self.phases.append(phase)
+        self._name = None
+        if self.log_phases:
+            self.log(phase)
+        return phase
+
+    def log(self, phase):
+        msg = phase['name'] + ': ' + str(phase['wall_s']) + 's wall, ' + \
+              str(phase['cpu_s'] + phase['children_cpu_s']) + 's CPU, ' + \
+              format_size(phase['max_rss_kb'] * 1024) + ' peak RSS'
+        for key, val in phase.items():
+            if key.endswith('_per_s'):
+                msg += ', ' + str(val) + ' ' + key[:-len('_per_s')] + '/s'
+        logging.info(msg)
+
+    def write_json(self, path, **info):
+        cpu, child_cpu = get_cpu_times()
+        max_rss, child_max_rss = get_max_rss_kb()
+        report = {
+            'command': sys.argv,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        }
+        report.update(info)
+        report['total'] = {
+            'wall_s': round(time.perf_counter() - self._start, 4),
+            'cpu_s': round(cpu, 4),
+            'children_cpu_s': round(child_cpu, 4),
+            'max_rss_kb': max_rss,
+            'children_max_rss_kb': child_max_rss,
+        }
+        report['phases'] = self.phases
+        with open(path, 'wt') as fw:
+            json.dump(report, fw, indent=2)
+            fw.write('\n')
+
+# periodic progress messages for a scan over a file
+#
+# `get_position` returns the number of bytes of the file read so far, or None if it is unknown
+# (e.g. the file is decompressed by an external process).
+class ProgressMeter:
+    def __init__(self, label, unit, file_path, get_position, interval):
+        self.label = label
+        self.unit = unit
+        self.get_position = get_position
+        self.interval = interval
+        self.file_size = os.path.getsize(file_path) if os.path.isfile(file_path) else None
+        self._start = time.perf_counter()
+        self._last = self._start
+
+    def update(self, num):
+        now = time.perf_counter()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self._start
+        msg = self.label + ': ' + str(num) + ' ' + self.unit + ' (' + str(round(num / elapsed, 1)) + ' ' + self.unit + '/s)'
+        pos = self.get_position()
+        if pos is not None and self.file_size:
+            frac = pos / self.file_size
+            msg += ', ' + format_size(pos) + ' of ' + format_size(self.file_size) + ' (' + str(round(frac * 100, 1)) + '%)'
+            if frac > 0:
+                msg += ', ETA ' + str(timedelta(seconds=round(elapsed / frac - elapsed)))
+        logging.info(msg)
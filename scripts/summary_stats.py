@@ -0,0 +1,91 @@
+import math
+import sys
+from statistics import StatisticsError
+
+# Streaming summary statistics of integer values (e.g. feature lengths and counts).
+#
+# Values are accumulated in a histogram of their counts, so memory is bounded by the number of
+# distinct values rather than the number of values. The sum and the sum of squares are kept as
+# exact integers, so the mean and the standard deviation are computed without floating-point
+# error; the results are identical to those of `statistics.mean`, `statistics.median` and
+# `statistics.stdev` on the list of all values.
+
+SQRT_BIT_WIDTH = 2 * sys.float_info.mant_dig + 3
+
+# square root of n/m, rounded to the nearest integer using round-to-odd
+def integer_sqrt_of_frac_rto(n, m):
+    a = math.isqrt(n // m)
+    return a | (a*a*m != n)
+
+# square root of n/m as a float, correctly rounded
+def float_sqrt_of_frac(n, m):
+    q = (n.bit_length() - m.bit_length() - SQRT_BIT_WIDTH) // 2
+    if q >= 0:
+        numerator = integer_sqrt_of_frac_rto(n, m << 2 * q) << q
+        denominator = 1
+    else:
+        numerator = integer_sqrt_of_frac_rto(n << -2 * q, m)
+        denominator = 1 << -q
+    return numerator / denominator
+
+class IntegerSummary:
+    def __init__(self):
+        self.counts = dict()
+        self.n = 0
+        self.total = 0
+        self.total_squares = 0
+
+    def add(self, val):
+        self.counts[val] = self.counts.get(val, 0) + 1
+        self.n += 1
+        self.total += val
+        self.total_squares += val * val
+
+    def update(self, vals):
+        for val in vals:
+            self.add(val)
+
+    # get the values at the 0-based ranks `ranks` (in ascending order) of the sorted values
+    def get_ranked(self, ranks):
+        vals = list()
+        i = 0
+        cum = 0
+        for val in sorted(self.counts):
+            cum += self.counts[val]
+            while i < len(ranks) and ranks[i] < cum:
+                vals.append(val)
+                i += 1
+            if i == len(ranks):
+                break
+        return vals
+
+    def mean(self):
+        if self.n < 1:
+            raise StatisticsError('mean requires at least one data point')
+        if self.total % self.n == 0:
+            return self.total // self.n
+        return self.total / self.n
+
+    def stdev(self):
+        if self.n < 2:
+            raise StatisticsError('stdev requires at least two data points')
+        # sample variance as a fraction: (n * sum(x^2) - sum(x)^2) / (n * (n - 1))
+        num = self.n * self.total_squares - self.total * self.total
+        den = self.n * (self.n - 1)
+        g = math.gcd(num, den)
+        return float_sqrt_of_frac(num // g, den // g)
+
+    # [min, Q1, median, Q3, max, mean, stdev]
+    def get_summary(self):
+        n = self.n
+        if n < 1:
+            raise StatisticsError('no data points')
+        # Q1 and Q3 are the values at ranks n/4 and 3n/4
+        mid = n // 2
+        ranks = sorted([0, int(n/4), mid - 1 if n % 2 == 0 else mid, mid, int(n*3/4), n - 1])
+        vals = dict(zip(ranks, self.get_ranked(ranks)))
+        if n % 2 == 1:
+            median_val = vals[mid]
+        else:
+            median_val = (vals[mid - 1] + vals[mid]) / 2
+        return [vals[0], vals[int(n/4)], median_val, vals[int(n*3/4)], vals[n - 1], self.mean(), self.stdev()]
@@ -1,21 +1,48 @@
 import argparse
-import gzip
+import cProfile
+import heapq
+import itertools
 import logging
-import re
+import multiprocessing
+import os
+import pickle
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from collections import deque
+from cigar import get_max_indel
+from fileio import get_read_position, gzopen
+from gtf_index import load_gtf_index
+from id_index import load_ids
+from profiling import PhaseTimer, ProgressMeter
 
 # writtern by Ka Ming Nip @kmnip
 
 num_redundant = 0
 assigned_txpts = dict()
 
-# function to open both gzip'd and regular files
-def gzopen(file_path, mode='rt', compresslevel=6):
-    if file_path.lower().endswith('.gz'):
-        return gzip.open(file_path, mode=mode, compresslevel=compresslevel)
-    return open(file_path, mode)
+# number of PAF lines per shard evaluated by a worker process
+shard_size = 100000
+
+# cProfile profiler of the shard evaluation in this process
+shard_profiler = None
+
+# alignments of the PAF file kept in memory by sweep mode
+sweep_hits = None
+
+# version of the checkpoint state format
+CHECKPOINT_VERSION = 2
 
 def get_gene_map(gtf):
     gene_map = dict()
+    gtf_idx = load_gtf_index(gtf)
+    if gtf_idx:
+        for tid, gid in gtf_idx.transcript_genes():
+            gene_map[fix_name(tid)] = fix_name(gid)
+        return gene_map
     with gzopen(gtf) as fh:
         for line in fh:
             line = line.strip()
@@ -35,7 +62,68 @@ def get_gene_map(gtf):
                             break
     return gene_map
 
-def get_tpm_bin_map(tsv, truth_set):
+# integer-coded table of the reference transcripts
+#
+# Transcripts and genes are coded in order of their first appearance in the GTF file, and the
+# attributes of the transcripts are stored in arrays indexed by code. IDs are translated back to
+# strings only when the outputs are written. The last code is reserved for PAF targets that are
+# not in the GTF file.
+class TranscriptTable:
+    def __init__(self, gene_map):
+        self.tx_codes = dict()
+        self.tx_names = list()
+        self.gene_names = list()
+        self.tx_gene = array('i')
+        gene_codes = dict()
+        for tid, gid in gene_map.items():
+            gene = gene_codes.get(gid)
+            if gene is None:
+                gene = len(self.gene_names)
+                gene_codes[gid] = gene
+                self.gene_names.append(gid)
+            self.tx_codes[tid] = len(self.tx_names)
+            self.tx_names.append(tid)
+            self.tx_gene.append(gene)
+        self.unknown = len(self.tx_names)
+        self.tx_gene.append(-1)
+        
+        # whether the transcript is from a multi-transcript gene
+        gene_num_txs = array('i', [0]) * len(self.gene_names)
+        for gene in self.tx_gene[:-1]:
+            gene_num_txs[gene] += 1
+        self.tx_is_mtg = bytearray(gene_num_txs[gene] > 1 for gene in self.tx_gene[:-1])
+        self.tx_is_mtg.append(0)
+        
+        self.tx_is_truth = bytearray(len(self.tx_names) + 1)
+        self.truth_txs = array('i')
+        # TPM quartile (0-3) of truth transcripts, -1 for others; None without expression levels
+        self.tx_tpm_bin = None
+        
+        # codes of PAF target names, which may differ from the transcript IDs by their versions
+        self._target_codes = dict()
+    
+    def set_truth(self, truth_ids):
+        for tid in truth_ids:
+            tx = self.tx_codes.get(tid)
+            if tx is None:
+                raise KeyError('truth transcript ' + tid + ' is not in the GTF file')
+            self.tx_is_truth[tx] = 1
+        self.truth_txs = array('i', (tx for tx in range(self.unknown) if self.tx_is_truth[tx]))
+    
+    def get_target_code(self, name):
+        tx = self._target_codes.get(name)
+        if tx is None:
+            tx = self.tx_codes.get(fix_name(name), self.unknown)
+            self._target_codes[name] = tx
+        return tx
+
+def get_gene(tx_gene, tx, qname):
+    gene = tx_gene[tx]
+    if gene < 0:
+        raise KeyError('target transcript of contig ' + qname + ' is not in the GTF file')
+    return gene
+
+def get_tpm_bin_map(tsv, tx_table):
     tpm_map = dict()
     tpms = list()
     with gzopen(tsv) as fh:
@@ -47,10 +135,10 @@ def get_tpm_bin_map(tsv, truth_set):
         # read rest of file
         for line in fh:
             cols = line.strip().split('\t')
-            tid = fix_name(cols[tid_col])
-            if tid in truth_set:
+            tx = tx_table.tx_codes.get(fix_name(cols[tid_col]))
+            if tx is not None and tx_table.tx_is_truth[tx]:
                 tpm = float(cols[tpm_col])
-                tpm_map[tid] = tpm
+                tpm_map[tx] = tpm
                 tpms.append(tpm)
     
     tpms.sort()
@@ -59,24 +147,24 @@ def get_tpm_bin_map(tsv, truth_set):
     m = tpms[int(length / 2)]
     q3 = tpms[int(length * 3 / 4)]
     
-    tpm_bin_map = dict()
-    for tid, tpm in tpm_map.items():
+    tpm_bin_map = array('b', [-1]) * len(tx_table.tx_gene)
+    for tx, tpm in tpm_map.items():
         if tpm <= q1:
-            tpm_bin_map[tid] = 0
+            tpm_bin_map[tx] = 0
         elif tpm <= m:
-            tpm_bin_map[tid] = 1
+            tpm_bin_map[tx] = 1
         elif tpm <= q3:
-            tpm_bin_map[tid] = 2
+            tpm_bin_map[tx] = 2
         else:
-            tpm_bin_map[tid] = 3
+            tpm_bin_map[tx] = 3
     
-    return tpm_bin_map, (round(tpms[0], 2), round(q1, 2), round(m, 2), round(q3, 2), round(tpms[-1], 2))
+    return tpm_bin_map, len(tpm_map), (round(tpms[0], 2), round(q1, 2), round(m, 2), round(q3, 2), round(tpms[-1], 2))
 
-def get_tpm_quartile_size(tid_recon_list, tpm_bin_map):
+def get_tpm_quartile_size(txs, tpm_bin_map):
     bin_sizes = [0, 0, 0, 0]
-    for t in tid_recon_list:
-        b = tpm_bin_map[t[0]]
-        assert b is not None
+    for tx in txs:
+        b = tpm_bin_map[tx]
+        assert b >= 0
         bin_sizes[b] += 1
     return bin_sizes
 
@@ -86,105 +174,108 @@ def fix_name(name):
         return name.split('.')[0]
     return name
 
-def get_combined_length(start1, end1, start2, end2):
-    if start2 <= end1 and end2 >= end1:
-        # dovetail: 1 -> 2
-        return end2 - start1
-    elif start1 <= end2 and end1 >= end2:
-        # dovetail: 2 -> 1
-        return end1 - start2
-    elif start2 > end1 or end2 < start1:
-        # no overlap: 1,2 or 2,1
-        return (end1 - start1) + (end2 - start2)
-    elif start2 >= start1 and end2 <= end1:
-        # contained: 2 in 1
-        return end1 - start1
-    elif start1 >= start2 and end1 <= start1:
-        # contained: 1 in 2
-        return end2 - start2
-    return None
-
 def get_paf_cigar(cols):
     for i in range(12, len(cols)):
-        tag, tmp, val = cols[i].split(':')
-        if tag == 'cg':
-            return val
+        if cols[i].startswith('cg:Z:'):
+            return cols[i][5:]
     return None
 
-def get_max_indel(cigar):
-    max_indel = 0
-    if cigar:
-        for op in re.findall(r'(\d+)[DI]', cigar):
-            max_indel = max(max_indel, int(op))
-    return max_indel
+# convert the PAF columns used for evaluation once per alignment; fields keep
+# their PAF column positions, except that the target name is replaced by its
+# transcript code and the mapping quality is replaced by the maximum indel size
+# of the alignment, followed by the CIGAR string
+#
+# The indel scan stops once `max_aln_indel` is exceeded, so the stored size is
+# exact only for alignments that pass the indel filter.
+def parse_paf_record(cols, max_aln_indel):
+    cigar = get_paf_cigar(cols)
+    return (cols[0], int(cols[1]), int(cols[2]), int(cols[3]), cols[4],
+            tx_table.get_target_code(cols[5]), int(cols[6]), int(cols[7]), int(cols[8]),
+            int(cols[9]), int(cols[10]), get_max_indel(cigar, max_aln_indel), cigar)
 
 def evaluate_batch(batch, txpt_recon_props, min_aln_len, min_aln_pid, max_aln_indel,
-                  truth_ids, gene_map, full_prop):
-    # find the best record
+                  tx_is_truth, tx_gene, full_prop):
+    # find the best record in one pass; the best record among all records is
+    # used only if every record has an indel that is too large; records without
+    # matches are never the best record
     best_record = None
     best_nmatch = 0
+    any_best_record = None
+    any_best_nmatch = 0
     has_skipped_record = False
     
-    for cols in batch:
-        nmatch = int(cols[9])
-        blen = int(cols[10])
+    for rec in batch:
+        nmatch = rec[9]
         
-        if get_max_indel(get_paf_cigar(cols)) <= max_aln_indel:
-            tname = cols[5]
-            
+        if rec[11] <= max_aln_indel:
             if nmatch > best_nmatch:
-                best_record = cols
+                best_record = rec
                 best_nmatch = nmatch
-            elif nmatch == best_nmatch:
-                if tname in truth_ids and best_record[5] not in truth_ids:
-                    best_record = cols
+            elif nmatch == best_nmatch and best_record:
+                if tx_is_truth[rec[5]] and not tx_is_truth[best_record[5]]:
+                    best_record = rec
         else:
             has_skipped_record = True
         
+        if nmatch > any_best_nmatch:
+            any_best_record = rec
+            any_best_nmatch = nmatch
+        elif nmatch == any_best_nmatch and any_best_record:
+            if tx_is_truth[rec[5]] and not tx_is_truth[any_best_record[5]]:
+                any_best_record = rec
+        
     if has_skipped_record and not best_record:
-        for cols in batch:
-            tname = cols[5]
-            nmatch = int(cols[9])
-            
-            if nmatch > best_nmatch:
-                best_record = cols
-                best_nmatch = nmatch
-            elif nmatch == best_nmatch:
-                if tname in truth_ids and best_record[5] not in truth_ids:
-                    best_record = cols
+        best_record = any_best_record
     
     if best_record:
         qname = best_record[0]
         best_tname = best_record[5]
-        best_tlen = int(best_record[6])
-        best_tstart = int(best_record[7])
-        best_tend = int(best_record[8])
-        best_gene = gene_map[best_tname]
-        best_pid = float(best_record[9])/float(best_record[10])
+        best_tlen = best_record[6]
+        best_tstart = best_record[7]
+        best_tend = best_record[8]
+        best_gene = get_gene(tx_gene, best_tname, qname)
+        best_pid = best_record[9]/best_record[10]
         
         if len(batch) > 1:
             # attempt to find misassembly
-            best_qlen = int(best_record[1])
-            best_qstart = int(best_record[2])
-            best_qend = int(best_record[3])
+            best_qlen = best_record[1]
+            best_qstart = best_record[2]
+            best_qend = best_record[3]
+            best_len = best_qend - best_qstart
             alt_best_record = None
             # the alt record must have at least `min_aln_len` nucleotides that are not already covered by the best record
-            min_len = best_qend - best_qstart + min_aln_len
-            merged_length = best_qend - best_qstart
+            min_len = best_len + min_aln_len
+            merged_length = best_len
+            # the query intervals are compared inline, as this loop runs over every secondary alignment
             for r in batch:
                 if r is not best_record:
-                    qstart = int(r[2])
-                    qend = int(r[3])
-                    m = get_combined_length(best_qstart, best_qend, qstart, qend)
+                    qstart = r[2]
+                    qend = r[3]
+                    # combined length of the best and the alt intervals
+                    if qend >= best_qend:
+                        if qstart <= best_qend:
+                            # dovetail: best -> alt, or best contained in alt
+                            m = qend - best_qstart
+                        else:
+                            # no overlap: best, alt
+                            m = best_len + qend - qstart
+                    elif best_qstart <= qend:
+                        # dovetail: alt -> best, or alt contained in best
+                        m = best_qend - qstart
+                    else:
+                        # no overlap: alt, best
+                        m = best_len + qend - qstart
                     if m >= min_len and m > merged_length:
                         alt_best_record = r
                         merged_length = m
             if alt_best_record:
                 alt_best_tname = alt_best_record[5]
-                return ('MISASSEMBLY', qname, best_tname, alt_best_tname, gene_map[alt_best_tname] == best_gene)
+                return ('MISASSEMBLY', qname, best_tname, alt_best_tname, get_gene(tx_gene, alt_best_tname, qname) == best_gene)
         
-        max_indel = get_max_indel(get_paf_cigar(best_record))
+        max_indel = best_record[11]
         if max_indel > max_aln_indel:
+            # get the exact size for the report
+            max_indel = get_max_indel(best_record[12])
             # indel too large
             #return ('MISASSEMBLY', qname, best_tname, best_tname, True)
             return ('LARGEINDEL', qname, best_tname, max_indel)
@@ -217,428 +308,926 @@ def evaluate_batch(batch, txpt_recon_props, min_aln_len, min_aln_pid, max_aln_in
         return ('RECONSTRUCTION', qname, best_tname, trp, best_pid)
         
     return None
+
+# parse the alignments kept by `max_hits` in their order in the PAF file
+def get_top_hits(hits, max_aln_indel):
+    hits.sort(key=lambda hit: -hit[1])
+    return [parse_paf_record(cols, max_aln_indel) for nmatch, order, cols in hits]
+
+def paf_shard_generator(fh, size):
+    # split binary PAF lines into shards; the alignments of a query never straddle two shards
+    shard = list()
+    prev_qname = None
+    for line in fh:
+        qname = line[:line.find(b'\t')]
+        if len(shard) >= size and qname != prev_qname:
+            yield shard
+            shard = list()
+        shard.append(line)
+        prev_qname = qname
+    if len(shard) > 0:
+        yield shard
+
+def evaluate_shard(lines):
+    # evaluate all query batches of a shard with its own
+    # `txpt_recon_props`, `assigned_txpts` and `num_redundant`
+    global num_redundant, assigned_txpts
+    num_redundant = 0
+    assigned_txpts = dict()
+    txpt_recon_props = dict()
+    results = list()
+    num_queries = 0
+    
+    batch = list()
+    # with `max_hits`, a min-heap of (matches, -order, columns) of the kept alignments of the
+    # query; alignments are parsed only when the query is evaluated
+    hits = list()
+    num_hits = 0
+    prev_qname = None
+    for line in lines:
+        cols = line.decode().strip().split('\t')
         
+        qname = cols[0]
+        blen = int(cols[10])
         
+        if prev_qname != qname:
+            num_queries += 1
+        
+        if prev_qname and prev_qname != qname and (len(batch) > 0 or len(hits) > 0):
+            if max_hits:
+                batch = get_top_hits(hits, max_aln_indel)
+                hits = list()
+                num_hits = 0
+            result = evaluate_batch(batch, txpt_recon_props, min_aln_len, min_aln_pid,
+                         max_aln_indel, tx_table.tx_is_truth, tx_table.tx_gene, min_full_prop)
+            if result:
+                results.append(result)
+            batch = list()
+            
+        if blen >= min_aln_len:
+            if max_hits:
+                # keep the `max_hits` alignments with the most matches; ties keep the earlier alignments
+                hit = (int(cols[9]), -num_hits, cols)
+                num_hits += 1
+                if len(hits) < max_hits:
+                    heapq.heappush(hits, hit)
+                else:
+                    heapq.heappushpop(hits, hit)
+            else:
+                batch.append(parse_paf_record(cols, max_aln_indel))
+            
+        prev_qname = qname
+    
+    # process the last query's alignments
+    if max_hits:
+        batch = get_top_hits(hits, max_aln_indel)
+    result = evaluate_batch(batch, txpt_recon_props, min_aln_len, min_aln_pid,
+                 max_aln_indel, tx_table.tx_is_truth, tx_table.tx_gene, min_full_prop)
+    if result:
+        results.append(result)
+    
+    return (results, txpt_recon_props, assigned_txpts, num_redundant, num_queries, len(lines), sum(map(len, lines)))
 
-parser = argparse.ArgumentParser(description='Evaluate transcriptome assembly quality')
-parser.add_argument('assembly',
-                    help='path of assembly FASTA file')
-parser.add_argument('paf',
-                    help='path of input PAF file')
-parser.add_argument('truth',
-                    help='path of truth transcript IDs')
-parser.add_argument('gtf',
-                    help='path of GTF')
-parser.add_argument('outprefix',
-                    help='path of output prefix')
-parser.add_argument('--full_prop', dest='full_prop', default='0.95', metavar='FLOAT', type=float,
-                    help='minimum length proportion for full-length transcripts (default: %(default)s)')
-parser.add_argument('--aln_pid', dest='aln_pid', default='0.95', metavar='FLOAT', type=float,
-                    help='minimum alignment percent identity (default: %(default)s)')
-parser.add_argument('--aln_len', dest='aln_len', default='100', metavar='INT', type=int,
-                    help='minimum alignment length (default: %(default)s)')
-parser.add_argument('--aln_indel', dest='aln_indel', default='70', metavar='INT', type=int,
-                    help='maximum alignment indel (default: %(default)s)')
-parser.add_argument('--tpm', dest='tpm', metavar='TSV', type=str,
-                    help='path of transcript expression TSV')
-args = parser.parse_args()
-
-logging.basicConfig(
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
-
-min_aln_pid = args.aln_pid
-min_aln_len = args.aln_len
-min_full_prop = args.full_prop
-max_aln_indel = args.aln_indel
-
-truth_ids = set()
-logging.info('parsing truth file...')
-with gzopen(args.truth) as fh:
-    for line in fh:
-        truth_ids.add(line.strip())
-
-tpm_bin_map = None
-tpm_quantiles = None
-if args.tpm:
-    logging.info('parsing abundance file...')
-    tpm_bin_map, tpm_quantiles = get_tpm_bin_map(args.tpm, truth_ids)
-    logging.info('TPM quantiles:')
-    logging.info('min\tq1\tM\tq3\tmax')
-    logging.info(str(tpm_quantiles[0]) +
-        '\t' + str(tpm_quantiles[1]) +
-        '\t' + str(tpm_quantiles[2]) +
-        '\t' + str(tpm_quantiles[3]) +
-        '\t' + str(tpm_quantiles[4]))
-
-logging.info('parsing GTF file...')
-gene_map = get_gene_map(args.gtf)
-
-gene_transcript_count_map = dict()
-for tid, gid in gene_map.items():
-    if gid in gene_transcript_count_map:
-        gene_transcript_count_map[gid] += 1
+def profile_shard(lines):
+    # accumulate the profile of all shards evaluated by this process
+    global shard_profiler
+    if shard_profiler is None:
+        shard_profiler = cProfile.Profile()
+    shard_profiler.enable()
+    shard_results = evaluate_shard(lines)
+    shard_profiler.disable()
+    if os.getpid() != main_pid:
+        # worker processes are never shut down gracefully, so dump after every shard
+        shard_profiler.dump_stats(os.path.join(cprofile_dir, str(os.getpid())))
+    return shard_results
+
+def imap_ordered(pool, func, iterable, max_pending):
+    # like `pool.imap`, but do not consume `iterable` faster than results are collected
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+def set_parameters(full_prop, aln_pid, aln_len, aln_indel, hits=None):
+    global min_full_prop, min_aln_pid, min_aln_len, max_aln_indel, max_hits
+    min_aln_pid = aln_pid
+    min_aln_len = aln_len
+    min_full_prop = full_prop
+    max_aln_indel = aln_indel
+    max_hits = hits
+
+# load the reference tables shared by the evaluation of all assemblies
+def load_references(truth, gtf, tpm, timer):
+    global tx_table, tpm_quantiles
+    
+    logging.info('parsing GTF file...')
+    timer.start('gtf')
+    tx_table = TranscriptTable(get_gene_map(gtf))
+    timer.stop(transcripts=len(tx_table.tx_names))
+    
+    logging.info('parsing truth file...')
+    timer.start('truth')
+    tx_table.set_truth(load_ids(truth))
+    timer.stop(transcripts=len(tx_table.truth_txs))
+    
+    tpm_quantiles = None
+    if tpm:
+        logging.info('parsing abundance file...')
+        timer.start('abundance')
+        tx_table.tx_tpm_bin, num_tpms, tpm_quantiles = get_tpm_bin_map(tpm, tx_table)
+        timer.stop(transcripts=num_tpms)
+        logging.info('TPM quantiles:')
+        logging.info('min\tq1\tM\tq3\tmax')
+        logging.info(str(tpm_quantiles[0]) +
+            '\t' + str(tpm_quantiles[1]) +
+            '\t' + str(tpm_quantiles[2]) +
+            '\t' + str(tpm_quantiles[3]) +
+            '\t' + str(tpm_quantiles[4]))
+
+def get_checkpoint_path(outprefix):
+    return outprefix + 'checkpoint.pkl'
+
+def write_checkpoint(path, state):
+    # write to a temporary file first so that a partial checkpoint is never loaded
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fw:
+        pickle.dump(state, fw, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def get_checkpoint_params():
+    return (min_full_prop, min_aln_pid, min_aln_len, max_aln_indel, max_hits, len(tx_table.tx_names))
+
+def read_checkpoint(path):
+    with open(path, 'rb') as fh:
+        state = pickle.load(fh)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('Unsupported checkpoint version in ' + path)
+    if state['params'] != get_checkpoint_params():
+        raise ValueError('Checkpoint ' + path + ' was written with different parameters or a different GTF file')
+    return state
+
+# move a binary file object to the line starting at `offset`
+def skip_to_offset(fh, paf, offset):
+    if offset == 0:
+        return
+    if fh.seekable():
+        fh.seek(offset - 1)
+        last = fh.read(1)
     else:
-        gene_transcript_count_map[gid] = 1
-
-# check whether gene ID is a multi-transcript gene
-def is_gid_mtg(gid):
-    global gene_transcript_count_map
-    num_txpt = gene_transcript_count_map[gid]
-    assert num_txpt > 0
-    return num_txpt > 1
-
-# check whether transcript ID is from a multi-transcript gene
-def is_tid_mtg(tid):
-    global gene_map, gene_transcript_count_map
-    gid = gene_map[tid]
-    num_txpt = gene_transcript_count_map[gid]
-    assert num_txpt > 0
-    return num_txpt > 1
-
-txpt_lengths = dict()
-txpt_recon_props = dict()
-logging.info('parsing PAF file...')
-"""
-1	string	Query sequence name
-2	int	Query sequence length
-3	int	Query start (0-based; BED-like; closed)
-4	int	Query end (0-based; BED-like; open)
-5	char	Relative strand: "+" or "-"
-6	string	Target sequence name
-7	int	Target sequence length
-8	int	Target start on original strand (0-based)
-9	int	Target end on original strand (0-based)
-10	int	Number of residue matches
-11	int	Alignment block length
-12	int	Mapping quality (0-255; 255 for missing)
-"""
-
-num_complete_contigs = 0
-num_partial_contigs = 0
-num_misassembled_contigs = 0
-num_false_pos_contigs = 0
-num_low_qual_contigs = 0
-num_large_indel_contigs = 0
-classified_contigs = set()
-unclassified_contigs = set()
-intragene_misassemblies = list()
-intergene_misassemblies = list()
-
-prev_qname = None
-with gzopen(args.paf) as fh, \
-    open(args.outprefix + 'reconstruction.tsv', 'wt') as fw, \
-    open(args.outprefix + 'lowquality.tsv', 'wt') as fw2, \
-    open(args.outprefix + 'largeindel.tsv', 'wt') as fw3:
-    
-    fw.write('contig_id\ttranscript_id\treconstruction\tpercent_identity\n')
-    fw2.write('contig_id\ttranscript_id\tpercent_identity\n')
-    fw3.write('contig_id\ttranscript_id\tmax_indel\n')
+        # decompressed by an external process
+        remaining = offset - 1
+        while remaining > 0:
+            num_read = len(fh.read(min(remaining, 1 << 20)))
+            if num_read == 0:
+                break
+            remaining -= num_read
+        last = fh.read(1)
+    if last != b'\n':
+        raise ValueError('PAF file ' + paf + ' does not match the checkpoint')
+
+# classify the truth transcripts by their maximum reconstruction and add the transcript and
+# misassembly rows to `summary`; returns the codes of the complete, partial, missing and
+# false-positive transcripts
+def tally_transcripts(txpt_recon_props, full_prop, intragene_misassemblies, intergene_misassemblies, summary):
+    tx_is_truth = tx_table.tx_is_truth
+    tx_is_mtg = tx_table.tx_is_mtg
+    tpm_bin_map = tx_table.tx_tpm_bin
     
-    batch = list()
+    complete = list()
+    partial = list()
+    missing = list()
+    
+    # transcripts of single transcript genes
+    complete_stg = list()
+    partial_stg = list()
+    missing_stg = list()
+    
+    # transcripts of multi-transcript genes
+    complete_mtg = list()
+    partial_mtg = list()
+    missing_mtg = list()
+    
+    for t in tx_table.truth_txs:
+        is_mtg = tx_is_mtg[t]
+        p = txpt_recon_props[t]
+        if p >= 0:
+            assert p <= 1.0
+            if p >= full_prop:
+                complete.append(t)
+                if is_mtg:
+                    complete_mtg.append(t)
+                else:
+                    complete_stg.append(t)
+            else:
+                partial.append(t)
+                if is_mtg:
+                    partial_mtg.append(t)
+                else:
+                    partial_stg.append(t)
+        else:
+            missing.append(t)
+            if is_mtg:
+                missing_mtg.append(t)
+            else:
+                missing_stg.append(t)
+    
+    false_pos = list()
+    false_pos_stg = list()
+    false_pos_mtg = list()
+    for fp in range(tx_table.unknown):
+        if txpt_recon_props[fp] >= 0 and not tx_is_truth[fp]:
+            false_pos.append(fp)
+            if tx_is_mtg[fp]:
+                false_pos_mtg.append(fp)
+            else:
+                false_pos_stg.append(fp)
+    
+    # check results
+    assert len(complete) == len(complete_stg) + len(complete_mtg)
+    assert len(partial) == len(partial_stg) + len(partial_mtg)
+    assert len(missing) == len(missing_stg) + len(missing_mtg)
+    assert len(false_pos) == len(false_pos_stg) + len(false_pos_mtg)
+    
+    def add_quartile_sizes(name, txs):
+        if tpm_bin_map:
+            q = 1
+            for val in get_tpm_quartile_size(txs, tpm_bin_map):
+                summary.append((name + " (Q" + str(q) +")", val))
+                q += 1
     
-    def process_batch():
-        result = evaluate_batch(batch, txpt_recon_props, min_aln_len, min_aln_pid,
-                     max_aln_indel, truth_ids, gene_map, min_full_prop)
-        if result:
+    summary.append(("complete transcripts", len(complete)))
+    add_quartile_sizes("complete transcripts", complete)
+    
+    summary.append(("partial transcripts", len(partial)))
+    add_quartile_sizes("partial transcripts", partial)
+    
+    summary.append(("missing transcripts", len(missing)))
+    add_quartile_sizes("missing transcripts", missing)
+    
+    summary.append(("false-positive transcripts", len(false_pos)))
+    
+    num_intragene_mis = len(intragene_misassemblies)
+    num_intergene_mis = len(intergene_misassemblies)
+    num_misassemblies = num_intragene_mis + num_intergene_mis
+    summary.append(("intra-gene misassemblies", num_intragene_mis))
+    summary.append(("inter-gene misassemblies", num_intergene_mis))
+    summary.append(("total misassemblies", num_misassemblies))
+    
+    num_intergene_mis_stg = 0
+    num_intergene_mis_mtg = 0
+    for m in intergene_misassemblies:
+        if tx_is_mtg[m[1]] or tx_is_mtg[m[2]]:
+            num_intergene_mis_mtg += 1
+        else:
+            num_intergene_mis_stg += 1
+            
+    num_intragene_mis_stg = 0
+    num_intragene_mis_mtg = 0
+    for m in intragene_misassemblies:
+        if tx_is_mtg[m[1]] or tx_is_mtg[m[2]]:
+            num_intragene_mis_mtg += 1
+        else:
+            num_intragene_mis_stg += 1
+    
+    # check results
+    assert num_intragene_mis == num_intragene_mis_stg + num_intragene_mis_mtg
+    assert num_intergene_mis == num_intergene_mis_stg + num_intergene_mis_mtg
+    
+    # transcripts from single-transcript genes
+    summary.append(("STG complete transcripts", len(complete_stg)))
+    add_quartile_sizes("STG complete transcripts", complete_stg)
+    
+    summary.append(("STG partial transcripts", len(partial_stg)))
+    add_quartile_sizes("STG partial transcripts", partial_stg)
+    
+    summary.append(("STG missing transcripts", len(missing_stg)))
+    add_quartile_sizes("STG missing transcripts", missing_stg)
+    
+    summary.append(("STG false-positive transcripts", len(false_pos_stg)))
+    summary.append(("STG intra-gene misassemblies", num_intragene_mis_stg))
+    summary.append(("STG inter-gene misassemblies", num_intergene_mis_stg))
+    summary.append(("STG total misassemblies", num_intragene_mis_stg + num_intergene_mis_stg))
+    
+    # transcripts from multi-transcript genes
+    summary.append(("MTG complete transcripts", len(complete_mtg)))
+    add_quartile_sizes("MTG complete transcripts", complete_mtg)
+    
+    summary.append(("MTG partial transcripts", len(partial_mtg)))
+    add_quartile_sizes("MTG partial transcripts", partial_mtg)
+    
+    summary.append(("MTG missing transcripts", len(missing_mtg)))
+    add_quartile_sizes("MTG missing transcripts", missing_mtg)
+    
+    summary.append(("MTG false-positive transcripts", len(false_pos_mtg)))
+    summary.append(("MTG intra-gene misassemblies", num_intragene_mis_mtg))
+    summary.append(("MTG inter-gene misassemblies", num_intergene_mis_mtg))
+    summary.append(("MTG total misassemblies", num_intragene_mis_mtg + num_intergene_mis_mtg))
+    
+    return complete, partial, missing, false_pos
+
+# evaluate an assembly against the loaded references; writes the per-assembly
+# output files and returns the summary as a list of (name, value)
+#
+# With `checkpoint_interval`, the state of the evaluation is written to `outprefix` + `checkpoint.pkl`
+# every `checkpoint_interval` seconds and after the PAF file is evaluated. With `resume`, the state is
+# restored and the evaluation continues from the end of the last checkpointed shard; if the checkpoint
+# is of another PAF file, the alignments of `paf` are added to the restored state.
+def evaluate_assembly(assembly, paf, outprefix, threads=1, timer=None, progress_interval=None, cprofile=None,
+                      checkpoint_interval=None, resume=False):
+    global main_pid, cprofile_dir
+    
+    if timer is None:
+        timer = PhaseTimer()
+    summary = list()
+    tx_names = tx_table.tx_names
+    tx_is_truth = tx_table.tx_is_truth
+    
+    # maximum reconstruction of each transcript; -1 if not reconstructed
+    txpt_recon_props = array('d', [-1.0]) * len(tx_table.tx_gene)
+    merged_assigned_txpts = dict()
+    merged_num_redundant = 0
+    logging.info('parsing PAF file...')
+    """
+    1	string	Query sequence name
+    2	int	Query sequence length
+    3	int	Query start (0-based; BED-like; closed)
+    4	int	Query end (0-based; BED-like; open)
+    5	char	Relative strand: "+" or "-"
+    6	string	Target sequence name
+    7	int	Target sequence length
+    8	int	Target start on original strand (0-based)
+    9	int	Target end on original strand (0-based)
+    10	int	Number of residue matches
+    11	int	Alignment block length
+    12	int	Mapping quality (0-255; 255 for missing)
+    """
+    
+    num_complete_contigs = 0
+    num_partial_contigs = 0
+    num_misassembled_contigs = 0
+    num_false_pos_contigs = 0
+    num_low_qual_contigs = 0
+    num_large_indel_contigs = 0
+    classified_contigs = set()
+    unclassified_contigs = dict()
+    intragene_misassemblies = list()
+    intergene_misassemblies = list()
+    
+    # merge the reconstructions of a shard into the results of all previous shards
+    def merge_shard(shard_txpt_recon_props, shard_assigned_txpts, shard_num_redundant):
+        nonlocal merged_num_redundant
+        merged_num_redundant += shard_num_redundant
+        
+        for tx, trp in shard_txpt_recon_props.items():
+            if trp > txpt_recon_props[tx]:
+                txpt_recon_props[tx] = trp
+        
+        for tid, cids in shard_assigned_txpts.items():
+            if tid in merged_assigned_txpts:
+                # the first full-length contig in this shard is also redundant
+                merged_num_redundant += 1
+                merged_assigned_txpts[tid].extend(cids)
+            else:
+                merged_assigned_txpts[tid] = cids
+    
+    timer.start('paf')
+    num_paf_queries = 0
+    num_paf_lines = 0
+    paf_offset = 0
+    
+    checkpoint_path = get_checkpoint_path(outprefix)
+    state = None
+    if resume:
+        state = read_checkpoint(checkpoint_path)
+        num_complete_contigs, num_partial_contigs, num_misassembled_contigs, \
+            num_false_pos_contigs, num_low_qual_contigs, num_large_indel_contigs = state['contig_counts']
+        classified_contigs = state['classified_contigs']
+        intragene_misassemblies = state['intragene_misassemblies']
+        intergene_misassemblies = state['intergene_misassemblies']
+        txpt_recon_props = state['txpt_recon_props']
+        merged_assigned_txpts = state['assigned_txpts']
+        merged_num_redundant = state['num_redundant']
+        num_paf_queries = state['num_paf_queries']
+        num_paf_lines = state['num_paf_lines']
+        if state['paf'] == os.path.abspath(paf):
+            paf_offset = state['paf_offset']
+            logging.info('resuming from line ' + str(num_paf_lines + 1) + ' of PAF file...')
+        else:
+            logging.info('adding PAF file to the evaluation of ' + state['paf'] + '...')
+    
+    def get_state():
+        for f in [fw, fw2, fw3]:
+            f.flush()
+        return {
+            'version': CHECKPOINT_VERSION,
+            'params': get_checkpoint_params(),
+            'paf': os.path.abspath(paf),
+            'paf_offset': paf_offset,
+            'num_paf_queries': num_paf_queries,
+            'num_paf_lines': num_paf_lines,
+            'contig_counts': (num_complete_contigs, num_partial_contigs, num_misassembled_contigs,
+                              num_false_pos_contigs, num_low_qual_contigs, num_large_indel_contigs),
+            'classified_contigs': classified_contigs,
+            'intragene_misassemblies': intragene_misassemblies,
+            'intergene_misassemblies': intergene_misassemblies,
+            'txpt_recon_props': txpt_recon_props,
+            'assigned_txpts': merged_assigned_txpts,
+            'num_redundant': merged_num_redundant,
+            'output_sizes': [f.tell() for f in [fw, fw2, fw3]],
+        }
+    
+    # outputs written while evaluating the PAF file; truncated to their checkpointed sizes when resuming
+    output_headers = [('reconstruction.tsv', 'contig_id\ttranscript_id\treconstruction\tpercent_identity\n'),
+                      ('lowquality.tsv', 'contig_id\ttranscript_id\tpercent_identity\n'),
+                      ('largeindel.tsv', 'contig_id\ttranscript_id\tmax_indel\n')]
+    def open_output(i):
+        suffix, header = output_headers[i]
+        if state:
+            os.truncate(outprefix + suffix, state['output_sizes'][i])
+            return open(outprefix + suffix, 'at')
+        f = open(outprefix + suffix, 'wt')
+        f.write(header)
+        return f
+    
+    shard_func = evaluate_shard
+    main_pid = os.getpid()
+    cprofile_dir = None
+    if cprofile:
+        shard_func = profile_shard
+        if threads > 1:
+            cprofile_dir = tempfile.mkdtemp(dir=os.path.dirname(cprofile) or '.')
+    
+    pool = None
+    if threads > 1:
+        # worker processes are forked before any decompression threads are started
+        # so that they share the reference tables
+        pool = multiprocessing.get_context('fork').Pool(threads)
+    
+    with gzopen(paf, 'rb', threads=threads) as fh, \
+        open_output(0) as fw, \
+        open_output(1) as fw2, \
+        open_output(2) as fw3:
+        
+        skip_to_offset(fh, paf, paf_offset)
+        
+        def process_result(result):
+            nonlocal num_misassembled_contigs, num_large_indel_contigs, num_complete_contigs, \
+                num_partial_contigs, num_false_pos_contigs, num_low_qual_contigs
             result_type = result[0]
             if result_type == 'MISASSEMBLY':
-                classified_contigs.add(prev_qname)
+                classified_contigs.add(result[1])
                 if result[-1]:
                    intragene_misassemblies.append(result[1:])
                 else:
                    intergene_misassemblies.append(result[1:])
-                global num_misassembled_contigs
                 num_misassembled_contigs += 1
             elif result_type == 'LARGEINDEL':
-                classified_contigs.add(prev_qname)
-                cid, tid, maxindel = result[1:]
-                fw3.write(cid + '\t' + tid + '\t' + str(maxindel) + '\n')
-                global num_large_indel_contigs
+                classified_contigs.add(result[1])
+                cid, tx, maxindel = result[1:]
+                fw3.write(cid + '\t' + tx_names[tx] + '\t' + str(maxindel) + '\n')
                 num_large_indel_contigs += 1
             elif result_type == 'RECONSTRUCTION':
-                classified_contigs.add(prev_qname)
-                cid, tid, reconstruction, pid = result[1:]
-                fw.write(cid + '\t' + tid + '\t' + str(reconstruction) + '\t' + str(pid) + '\n')
-                if tid in truth_ids:
+                classified_contigs.add(result[1])
+                cid, tx, reconstruction, pid = result[1:]
+                fw.write(cid + '\t' + tx_names[tx] + '\t' + str(reconstruction) + '\t' + str(pid) + '\n')
+                if tx_is_truth[tx]:
                     # not a false positive
                     if reconstruction >= min_full_prop:
                         # a "complete" reconstruction
-                        global num_complete_contigs
                         num_complete_contigs += 1
                     else:
                         # a "partial" reconstruction
-                        global num_partial_contigs
                         num_partial_contigs += 1
                 else:
                     # a false positive
-                    global num_false_pos_contigs
                     num_false_pos_contigs += 1
             elif result_type == 'LOWQUALITY':
-                classified_contigs.add(prev_qname)
-                cid, tid, pid = result[1:]
-                fw2.write(cid + '\t' + tid + '\t' + str(pid) + '\n')
-                global num_low_qual_contigs
+                classified_contigs.add(result[1])
+                cid, tx, pid = result[1:]
+                fw2.write(cid + '\t' + tx_names[tx] + '\t' + str(pid) + '\n')
                 num_low_qual_contigs += 1
+        
+        shards = paf_shard_generator(fh, shard_size)
+        
+        if pool:
+            shard_results = imap_ordered(pool, shard_func, shards, 2 * threads)
+        else:
+            shard_results = map(shard_func, shards)
+        
+        progress = None
+        if progress_interval:
+            progress = ProgressMeter('PAF', 'contigs', paf, lambda: get_read_position(fh), progress_interval)
+        
+        # shards are merged in file order so the outputs are identical to a single-process run
+        last_checkpoint = time.monotonic()
+        for results, shard_txpt_recon_props, shard_assigned_txpts, shard_num_redundant, shard_num_queries, shard_num_lines, shard_num_bytes in shard_results:
+            for result in results:
+                process_result(result)
+            merge_shard(shard_txpt_recon_props, shard_assigned_txpts, shard_num_redundant)
+            num_paf_queries += shard_num_queries
+            num_paf_lines += shard_num_lines
+            paf_offset += shard_num_bytes
+            if progress:
+                progress.update(num_paf_queries)
+            if checkpoint_interval is not None and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                write_checkpoint(checkpoint_path, get_state())
+                last_checkpoint = time.monotonic()
+        
+        if checkpoint_interval is not None:
+            write_checkpoint(checkpoint_path, get_state())
+        
+        if pool:
+            pool.close()
+            pool.join()
     
-    for line in fh:
-        cols = line.strip().split('\t')
+    if cprofile:
+        stats = pstats.Stats(shard_profiler) if shard_profiler else None
+        if cprofile_dir:
+            for name in os.listdir(cprofile_dir):
+                path = os.path.join(cprofile_dir, name)
+                if stats:
+                    stats.add(path)
+                else:
+                    stats = pstats.Stats(path)
+            shutil.rmtree(cprofile_dir)
+        if stats:
+            stats.dump_stats(cprofile)
+    
+    timer.stop(lines=num_paf_lines, contigs=num_paf_queries)
+    
+    # parse assembly FASTA
+    # sequences of unclassified contigs are spooled to a temporary file so that only
+    # their offsets are kept in memory
+    logging.info('parsing assembly file...')
+    timer.start('assembly')
+    assembly_cids = set()
+    outdir = os.path.dirname(outprefix) or '.'
+    with gzopen(assembly, 'rb', threads=threads) as fh, tempfile.TemporaryFile(dir=outdir) as tmp:
+        cid = None
+        is_unclassified = False
+        start = 0
+        for line in fh:
+            if line[0] == 62: # '>'
+                if is_unclassified:
+                    # store offsets of previous seq
+                    unclassified_contigs[cid] = (start, tmp.tell())
+                cid = line[1:].strip().split(b' ', 1)[0].decode()
+                assembly_cids.add(cid)
+                is_unclassified = cid not in classified_contigs
+                start = tmp.tell()
+            elif is_unclassified:
+                tmp.write(line.strip())
+        if is_unclassified:
+            # store offsets of final seq
+            unclassified_contigs[cid] = (start, tmp.tell())
+        num_contigs = len(assembly_cids)
         
-        qname = cols[0]
-        tname = fix_name(cols[5])
-        cols[5] = tname
-        tlen = int(cols[6])
-        nmatch = int(cols[9])
-        blen = int(cols[10])
+        summary.append(("total contigs", num_contigs))
+        summary.append(("complete contigs", num_complete_contigs))
+        summary.append(("partial contigs", num_partial_contigs))
+        summary.append(("misassembled contigs", num_misassembled_contigs))
+        summary.append(("false-positive contigs", num_false_pos_contigs))
+        summary.append(("large-indel contigs", num_large_indel_contigs))
+        summary.append(("low-quality contigs", num_low_qual_contigs))
         
-        txpt_lengths[tname] = tlen
+        num_unclassified_contigs = num_contigs - num_complete_contigs \
+                                   - num_partial_contigs - num_misassembled_contigs \
+                                   - num_false_pos_contigs - num_low_qual_contigs \
+                                   - num_large_indel_contigs
+        assert num_unclassified_contigs == len(unclassified_contigs)
+        summary.append(("unclassified contigs", num_unclassified_contigs))
         
-        if prev_qname and prev_qname != qname and len(batch) > 0:
-            process_batch()
-            batch = list()
-            
-        if blen >= min_aln_len:
-            batch.append(cols)
-            
-        prev_qname = qname
+        with open(outprefix + 'unclassified_contigs.fa', 'wb') as fw:
+            for cid in sorted(unclassified_contigs):
+                start, end = unclassified_contigs[cid]
+                tmp.seek(start)
+                fw.write(b'>' + cid.encode() + b'\n' + tmp.read(end - start) + b'\n')
+    timer.stop(contigs=num_contigs)
+    
+    # tally all results; transcripts are listed by their codes
+    timer.start('tally')
+    complete, partial, missing, false_pos = tally_transcripts(txpt_recon_props, min_full_prop,
+        intragene_misassemblies, intergene_misassemblies, summary)
+    
+    # write results
+    names = ['complete', 'partial', 'missing', 'false_pos']
+    lists = [complete, partial, missing, false_pos]
+    
+    for i in range(0, len(names)):
+        n = names[i]
+        l = lists[i]
+        with open(outprefix + n + '.tsv', 'wt') as fh:
+            fh.write('transcript_id\tmax_reconstruction\n')
+            if n == 'missing':
+                for t in l:
+                    fh.write(tx_names[t] + '\t0\n')
+            else:
+                l.sort(key=txpt_recon_props.__getitem__, reverse=True)
+                for t in l:
+                    fh.write(tx_names[t] + '\t' + str(txpt_recon_props[t]) + '\n')
+    
+    with open(outprefix + 'intergene_misassemblies.tsv', 'wt') as fh:
+        fh.write('contig_id\ttranscript_id1\ttranscript_id2\n')
+        for m in intergene_misassemblies:
+            fh.write(m[0] + '\t' + tx_names[m[1]] + '\t' + tx_names[m[2]] + '\n')
+    
+    with open(outprefix + 'intragene_misassemblies.tsv', 'wt') as fh:
+        fh.write('contig_id\ttranscript_id1\ttranscript_id2\n')
+        for m in intragene_misassemblies:
+            fh.write(m[0] + '\t' + tx_names[m[1]] + '\t' + tx_names[m[2]] + '\n')
+    
+    with open(outprefix + 'redundant.tsv', 'wt') as fh:
+        fh.write('transcript_id\tnum_contigs\tcontig_ids\n')
+        for ref, names in merged_assigned_txpts.items():
+            num_names = len(names)
+            if num_names > 1:
+                fh.write(tx_names[ref] + '\t' + str(num_names) + '\t' + ' '.join(names) + '\n')
+    
+    timer.stop(transcripts=len(tx_table.truth_txs) + len(false_pos))
+    
+    return summary
 
-    # process the last read's alignments
-    process_batch()
+# alignments of a PAF file kept in memory to evaluate many combinations of thresholds
+#
+# The PAF file is parsed once; alignments shorter than `min_len` are dropped and the fields used by
+# `evaluate_batch` are stored in arrays. The alignments of the i-th run of lines of the same contig
+# are at `query_offsets[i]:query_offsets[i+1]`. The indel scan stops once `max_indel` is exceeded,
+# as no combination accepts such alignments.
+class SweepHits:
+    def __init__(self, paf, min_len, max_indel, threads=1):
+        self.qnames = list()
+        self.query_offsets = array('q', [0])
+        self.qstart = array('l')
+        self.qend = array('l')
+        self.tx = array('i')
+        self.tlen = array('l')
+        self.tstart = array('l')
+        self.tend = array('l')
+        self.nmatch = array('l')
+        self.blen = array('l')
+        self.max_indel = array('l')
+        self.num_lines = 0
+        
+        prev_qname = None
+        with gzopen(paf, 'rb', threads=threads) as fh:
+            for line in fh:
+                self.num_lines += 1
+                cols = line.decode().strip().split('\t')
+                qname = cols[0]
+                if qname != prev_qname:
+                    self._close_query(prev_qname)
+                    prev_qname = qname
+                if int(cols[10]) >= min_len:
+                    rec = parse_paf_record(cols, max_indel)
+                    self.qstart.append(rec[2])
+                    self.qend.append(rec[3])
+                    self.tx.append(rec[5])
+                    self.tlen.append(rec[6])
+                    self.tstart.append(rec[7])
+                    self.tend.append(rec[8])
+                    self.nmatch.append(rec[9])
+                    self.blen.append(rec[10])
+                    self.max_indel.append(rec[11])
+        self._close_query(prev_qname)
+    
+    def _close_query(self, qname):
+        # contigs without any kept alignment are not stored
+        if len(self.nmatch) > self.query_offsets[-1]:
+            self.qnames.append(qname)
+            self.query_offsets.append(len(self.nmatch))
+    
+    def __len__(self):
+        return len(self.nmatch)
+    
+    # records of `evaluate_batch` of each contig with the alignments of at least `aln_len`;
+    # the query length, strand and CIGAR string are not kept
+    def batches(self, aln_len, max_hits=None):
+        qstart, qend, tx, tlen, tstart, tend, nmatch, blen, max_indel = \
+            self.qstart, self.qend, self.tx, self.tlen, self.tstart, self.tend, self.nmatch, self.blen, self.max_indel
+        query_offsets = self.query_offsets
+        for q, qname in enumerate(self.qnames):
+            batch = list()
+            for i in range(query_offsets[q], query_offsets[q+1]):
+                if blen[i] >= aln_len:
+                    batch.append((qname, 0, qstart[i], qend[i], None, tx[i], tlen[i], tstart[i], tend[i],
+                                  nmatch[i], blen[i], max_indel[i], None))
+            if max_hits and len(batch) > max_hits:
+                # as with `max_hits` in `evaluate_shard`
+                top = heapq.nlargest(max_hits, range(len(batch)), key=lambda k: (batch[k][9], -k))
+                batch = [batch[k] for k in sorted(top)]
+            yield batch
 
-# parse assembly FASTA
-logging.info('parsing assembly file...')
-assembly_cid_seq_dict = dict()
-with gzopen(args.assembly) as fh:
-    cid = None
-    seq = ''
-    for line in fh:
-        if line[0] == '>':
-            if cid:
-                # store previous seq
-                assembly_cid_seq_dict[cid] = seq
-            cid = line[1:].strip().split(' ', 1)[0]
-            seq = ''
-            if cid not in classified_contigs:
-                unclassified_contigs.add(cid)
-        else:
-            seq += line.strip()
-    if cid:
-        # store final seq
-        assembly_cid_seq_dict[cid] = seq
-num_contigs = len(assembly_cid_seq_dict)
-
-print("total contigs", num_contigs, sep='\t')
-print("complete contigs", num_complete_contigs, sep='\t')
-print("partial contigs", num_partial_contigs, sep='\t')
-print("misassembled contigs", num_misassembled_contigs, sep='\t')
-print("false-positive contigs", num_false_pos_contigs, sep='\t')
-print("large-indel contigs", num_large_indel_contigs, sep='\t')
-print("low-quality contigs", num_low_qual_contigs, sep='\t')
-
-num_unclassified_contigs = num_contigs - num_complete_contigs \
-                           - num_partial_contigs - num_misassembled_contigs \
-                           - num_false_pos_contigs - num_low_qual_contigs \
-                           - num_large_indel_contigs
-assert num_unclassified_contigs == len(unclassified_contigs)
-print("unclassified contigs", num_unclassified_contigs, sep='\t')
-
-with open(args.outprefix + 'unclassified_contigs.fa', 'wt') as fh:
-    for cid in sorted(unclassified_contigs):
-        fh.write('>' + cid + '\n' + assembly_cid_seq_dict[cid] + '\n')
-
-# tally all results
-complete = list()
-partial = list()
-missing = list()
-
-# transcripts of single transcript genes
-complete_stg = list()
-partial_stg = list()
-missing_stg = list()
-
-# transcripts of multi-transcript genes
-complete_mtg = list()
-partial_mtg = list()
-missing_mtg = list()
-
-for t in truth_ids:
-    is_mtg = is_tid_mtg(t)
-    if t in txpt_recon_props:
-        p = txpt_recon_props[t]
-        assert p <= 1.0
-        if p >= min_full_prop:
-            complete.append((t, p))
-            if is_mtg:
-                complete_mtg.append((t, p))
+# evaluate the alignments of `sweep_hits` with a combination of (full_prop, aln_pid, aln_len, aln_indel);
+# returns the summary of `evaluate_assembly` without writing any output files
+def evaluate_sweep_combination(params, num_contigs):
+    global num_redundant, assigned_txpts
+    full_prop, aln_pid, aln_len, aln_indel = params
+    tx_is_truth = tx_table.tx_is_truth
+    num_redundant = 0
+    assigned_txpts = dict()
+    shard_txpt_recon_props = dict()
+    
+    num_complete_contigs = 0
+    num_partial_contigs = 0
+    num_misassembled_contigs = 0
+    num_false_pos_contigs = 0
+    num_low_qual_contigs = 0
+    num_large_indel_contigs = 0
+    intragene_misassemblies = list()
+    intergene_misassemblies = list()
+    
+    for batch in sweep_hits.batches(aln_len, max_hits):
+        result = evaluate_batch(batch, shard_txpt_recon_props, aln_len, aln_pid, aln_indel,
+                                tx_is_truth, tx_table.tx_gene, full_prop)
+        if not result:
+            continue
+        result_type = result[0]
+        if result_type == 'MISASSEMBLY':
+            if result[-1]:
+                intragene_misassemblies.append(result[1:])
             else:
-                complete_stg.append((t, p))
-        else:
-            partial.append((t, p))
-            if is_mtg:
-                partial_mtg.append((t, p))
+                intergene_misassemblies.append(result[1:])
+            num_misassembled_contigs += 1
+        elif result_type == 'LARGEINDEL':
+            num_large_indel_contigs += 1
+        elif result_type == 'RECONSTRUCTION':
+            if tx_is_truth[result[2]]:
+                if result[3] >= full_prop:
+                    num_complete_contigs += 1
+                else:
+                    num_partial_contigs += 1
             else:
-                partial_stg.append((t, p))
-    else:
-        missing.append((t, 0))
-        if is_mtg:
-            missing_mtg.append((t, 0))
-        else:
-            missing_stg.append((t, 0))
-
-false_pos = list()
-false_pos_stg = list()
-false_pos_mtg = list()
-for fp in txpt_recon_props.keys() - truth_ids:
-    false_pos.append((fp, txpt_recon_props[fp]))
-    if is_tid_mtg(fp):
-        false_pos_mtg.append((fp, txpt_recon_props[fp]))
-    else:
-        false_pos_stg.append((fp, txpt_recon_props[fp]))
-
-# check results
-assert len(complete) == len(complete_stg) + len(complete_mtg)
-assert len(partial) == len(partial_stg) + len(partial_mtg)
-assert len(missing) == len(missing_stg) + len(missing_mtg)
-assert len(false_pos) == len(false_pos_stg) + len(false_pos_mtg)
-
-# print results
-
-print("complete transcripts", len(complete), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(complete, tpm_bin_map):
-        print("complete transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("partial transcripts", len(partial), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(partial, tpm_bin_map):
-        print("partial transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-    
-print("missing transcripts", len(missing), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(missing, tpm_bin_map):
-        print("missing transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("false-positive transcripts", len(false_pos), sep='\t')
-
-num_intragene_mis = len(intragene_misassemblies)
-num_intergene_mis = len(intergene_misassemblies)
-num_misassemblies = num_intragene_mis + num_intergene_mis
-print("intra-gene misassemblies", num_intragene_mis, sep='\t')
-print("inter-gene misassemblies", num_intergene_mis, sep='\t')
-print("total misassemblies", num_misassemblies, sep='\t')
-
-num_intergene_mis_stg = 0
-num_intergene_mis_mtg = 0
-for m in intergene_misassemblies:
-    tid1 = m[1]
-    tid2 = m[2]
-    if is_tid_mtg(tid1) or is_tid_mtg(tid2):
-        num_intergene_mis_mtg += 1
-    else:
-        num_intergene_mis_stg += 1
-        
-num_intragene_mis_stg = 0
-num_intragene_mis_mtg = 0
-for m in intragene_misassemblies:
-    tid1 = m[1]
-    tid2 = m[2]
-    if is_tid_mtg(tid1) or is_tid_mtg(tid2):
-        num_intragene_mis_mtg += 1
+                num_false_pos_contigs += 1
+        elif result_type == 'LOWQUALITY':
+            num_low_qual_contigs += 1
+    
+    txpt_recon_props = array('d', [-1.0]) * len(tx_table.tx_gene)
+    for tx, trp in shard_txpt_recon_props.items():
+        txpt_recon_props[tx] = trp
+    
+    summary = list()
+    summary.append(("total contigs", num_contigs))
+    summary.append(("complete contigs", num_complete_contigs))
+    summary.append(("partial contigs", num_partial_contigs))
+    summary.append(("misassembled contigs", num_misassembled_contigs))
+    summary.append(("false-positive contigs", num_false_pos_contigs))
+    summary.append(("large-indel contigs", num_large_indel_contigs))
+    summary.append(("low-quality contigs", num_low_qual_contigs))
+    summary.append(("unclassified contigs", num_contigs - num_complete_contigs
+                                            - num_partial_contigs - num_misassembled_contigs
+                                            - num_false_pos_contigs - num_low_qual_contigs
+                                            - num_large_indel_contigs))
+    tally_transcripts(txpt_recon_props, full_prop, intragene_misassemblies, intergene_misassemblies, summary)
+    return summary
+
+def evaluate_sweep_combination_star(args):
+    return evaluate_sweep_combination(*args)
+
+# evaluate an assembly with every combination of the threshold lists in a single pass over the
+# PAF file; writes one row of summary values per combination to `outprefix` + `sweep.tsv` and
+# returns the summaries
+def evaluate_sweep(assembly, paf, outprefix, full_props, aln_pids, aln_lens, aln_indels, threads=1, timer=None):
+    global sweep_hits
+    
+    if timer is None:
+        timer = PhaseTimer()
+    
+    logging.info('parsing PAF file...')
+    timer.start('paf')
+    sweep_hits = SweepHits(paf, min(aln_lens), max(aln_indels), threads)
+    timer.stop(lines=sweep_hits.num_lines, contigs=len(sweep_hits.qnames))
+    logging.info('kept ' + str(len(sweep_hits)) + ' alignments of ' + str(len(sweep_hits.qnames)) + ' contigs')
+    
+    logging.info('parsing assembly file...')
+    timer.start('assembly')
+    assembly_cids = set()
+    with gzopen(assembly, 'rb', threads=threads) as fh:
+        for line in fh:
+            if line[0] == 62: # '>'
+                assembly_cids.add(line[1:].strip().split(b' ', 1)[0])
+    num_contigs = len(assembly_cids)
+    timer.stop(contigs=num_contigs)
+    
+    combinations = list(itertools.product(full_props, aln_pids, aln_lens, aln_indels))
+    logging.info('evaluating ' + str(len(combinations)) + ' combinations of thresholds...')
+    timer.start('sweep')
+    args = [(params, num_contigs) for params in combinations]
+    if threads > 1 and len(combinations) > 1:
+        # worker processes are forked after the alignments are loaded
+        with multiprocessing.get_context('fork').Pool(threads) as pool:
+            summaries = pool.map(evaluate_sweep_combination_star, args, chunksize=1)
     else:
-        num_intragene_mis_stg += 1
-
-# check results
-assert num_intragene_mis == num_intragene_mis_stg + num_intragene_mis_mtg
-assert num_intergene_mis == num_intergene_mis_stg + num_intergene_mis_mtg
-
-# transcripts from single-transcript genes
-print("STG complete transcripts", len(complete_stg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(complete_stg, tpm_bin_map):
-        print("STG complete transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("STG partial transcripts", len(partial_stg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(partial_stg, tpm_bin_map):
-        print("STG partial transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-    
-print("STG missing transcripts", len(missing_stg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(missing_stg, tpm_bin_map):
-        print("STG missing transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("STG false-positive transcripts", len(false_pos_stg), sep='\t')
-print("STG intra-gene misassemblies", num_intragene_mis_stg, sep='\t')
-print("STG inter-gene misassemblies", num_intergene_mis_stg, sep='\t')
-print("STG total misassemblies", num_intragene_mis_stg + num_intergene_mis_stg, sep='\t')
-
-# transcripts from multi-transcript genes
-print("MTG complete transcripts", len(complete_mtg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(complete_mtg, tpm_bin_map):
-        print("MTG complete transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("MTG partial transcripts", len(partial_mtg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(partial_mtg, tpm_bin_map):
-        print("MTG partial transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-    
-print("MTG missing transcripts", len(missing_mtg), sep='\t')
-if tpm_bin_map:
-    q = 1
-    for val in get_tpm_quartile_size(missing_mtg, tpm_bin_map):
-        print("MTG missing transcripts (Q" + str(q) +")", val, sep='\t')
-        q += 1
-
-print("MTG false-positive transcripts", len(false_pos_mtg), sep='\t')
-print("MTG intra-gene misassemblies", num_intragene_mis_mtg, sep='\t')
-print("MTG inter-gene misassemblies", num_intergene_mis_mtg, sep='\t')
-print("MTG total misassemblies", num_intragene_mis_mtg + num_intergene_mis_mtg, sep='\t')
-
-# write results
-names = ['complete', 'partial', 'missing', 'false_pos']
-lists = [complete, partial, missing, false_pos]
-
-for i in range(0, len(names)):
-    n = names[i]
-    l = lists[i]
-    l.sort(key=lambda tup: tup[1], reverse=True)
-    with open(args.outprefix + n + '.tsv', 'wt') as fh:
-        fh.write('transcript_id\tmax_reconstruction\n')
-        for p in l:
-            fh.write(p[0] + '\t' + str(p[1]) + '\n')
-
-with open(args.outprefix + 'intergene_misassemblies.tsv', 'wt') as fh:
-    fh.write('contig_id\ttranscript_id1\ttranscript_id2\n')
-    for m in intergene_misassemblies:
-        fh.write('\t'.join(m[:-1]) + '\n')
+        summaries = list(map(evaluate_sweep_combination_star, args))
+    timer.stop(combinations=len(combinations))
+    
+    with open(outprefix + 'sweep.tsv', 'wt') as fw:
+        fw.write('full_prop\taln_pid\taln_len\taln_indel\t' + '\t'.join(name for name, val in summaries[0]) + '\n')
+        for params, summary in zip(combinations, summaries):
+            fw.write('\t'.join(str(p) for p in params) + '\t' + '\t'.join(str(val) for name, val in summary) + '\n')
+    
+    return summaries
 
-with open(args.outprefix + 'intragene_misassemblies.tsv', 'wt') as fh:
-    fh.write('contig_id\ttranscript_id1\ttranscript_id2\n')
-    for m in intragene_misassemblies:
-        fh.write('\t'.join(m[:-1]) + '\n')
+def write_summary(summary, fw):
+    for name, val in summary:
+        print(name, val, sep='\t', file=fw)
+
+def add_parameter_arguments(parser):
+    parser.add_argument('--full_prop', dest='full_prop', default='0.95', metavar='FLOAT', type=float,
+                        help='minimum length proportion for full-length transcripts (default: %(default)s)')
+    parser.add_argument('--aln_pid', dest='aln_pid', default='0.95', metavar='FLOAT', type=float,
+                        help='minimum alignment percent identity (default: %(default)s)')
+    parser.add_argument('--aln_len', dest='aln_len', default='100', metavar='INT', type=int,
+                        help='minimum alignment length (default: %(default)s)')
+    parser.add_argument('--aln_indel', dest='aln_indel', default='70', metavar='INT', type=int,
+                        help='maximum alignment indel (default: %(default)s)')
+    parser.add_argument('--max_hits', dest='max_hits', metavar='INT', type=get_min_int_type(1),
+                        help='evaluate only the INT alignments with the most matches of each contig (default: all alignments)')
+    parser.add_argument('--tpm', dest='tpm', metavar='TSV', type=str,
+                        help='path of transcript expression TSV')
+
+# argparse type of comma-separated values
+def get_list_type(item_type):
+    def parse_list(s):
+        return [item_type(val) for val in s.split(',')]
+    parse_list.__name__ = item_type.__name__ + ' list'
+    return parse_list
 
-with open(args.outprefix + 'redundant.tsv', 'wt') as fh:
-    fh.write('transcript_id\tnum_contigs\tcontig_ids\n')
-    for ref, names in assigned_txpts.items():
-        num_names = len(names)
-        if num_names > 1:
-            fh.write(ref + '\t' + str(num_names) + '\t' + ' '.join(names) + '\n')
+# argparse type of integers that are at least `min_val`
+def get_min_int_type(min_val):
+    def parse_int(s):
+        val = int(s)
+        if val < min_val:
+            raise argparse.ArgumentTypeError('must be at least ' + str(min_val) + ': ' + s)
+        return val
+    parse_int.__name__ = 'int'
+    return parse_int
 
+def init_logging():
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate transcriptome assembly quality')
+    parser.add_argument('assembly',
+                        help='path of assembly FASTA file')
+    parser.add_argument('paf',
+                        help='path of input PAF file')
+    parser.add_argument('truth',
+                        help='path of truth transcript IDs or their index built by `id_index.py`')
+    parser.add_argument('gtf',
+                        help='path of GTF')
+    parser.add_argument('outprefix',
+                        help='path of output prefix')
+    add_parameter_arguments(parser)
+    parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                        help='number of threads for decompressing inputs and worker processes for evaluating the PAF file (default: %(default)s)')
+    parser.add_argument('--progress', dest='progress', metavar='INT', type=int,
+                        help='log the progress of evaluating the PAF file every INT seconds')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='log the wall time, CPU time, peak memory and throughput of each phase and write them to `outprefix` + `timing.json`')
+    parser.add_argument('--cprofile', dest='cprofile', metavar='PATH', type=str,
+                        help='path of output cProfile statistics of evaluating the PAF file')
+    parser.add_argument('--checkpoint', dest='checkpoint', metavar='INT', type=int,
+                        help='write the state of evaluating the PAF file to `outprefix` + `checkpoint.pkl` every INT seconds')
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='resume from `outprefix` + `checkpoint.pkl`; the alignments of another PAF file are added to the checkpointed evaluation')
+    parser.add_argument('--sweep_full_prop', dest='sweep_full_prop', metavar='FLOAT,...', type=get_list_type(float),
+                        help='comma-separated values of `--full_prop` to sweep')
+    parser.add_argument('--sweep_aln_pid', dest='sweep_aln_pid', metavar='FLOAT,...', type=get_list_type(float),
+                        help='comma-separated values of `--aln_pid` to sweep')
+    parser.add_argument('--sweep_aln_len', dest='sweep_aln_len', metavar='INT,...', type=get_list_type(int),
+                        help='comma-separated values of `--aln_len` to sweep')
+    parser.add_argument('--sweep_aln_indel', dest='sweep_aln_indel', metavar='INT,...', type=get_list_type(int),
+                        help='comma-separated values of `--aln_indel` to sweep')
+    args = parser.parse_args()
+    
+    if args.resume and not os.path.isfile(get_checkpoint_path(args.outprefix)):
+        parser.error('no checkpoint ' + get_checkpoint_path(args.outprefix) + ' to resume from')
+    
+    sweep = args.sweep_full_prop or args.sweep_aln_pid or args.sweep_aln_len or args.sweep_aln_indel
+    if sweep and (args.checkpoint is not None or args.resume or args.cprofile):
+        parser.error('`--checkpoint`, `--resume` and `--cprofile` cannot be used with the `--sweep_*` options')
+    
+    init_logging()
+    
+    set_parameters(args.full_prop, args.aln_pid, args.aln_len, args.aln_indel, args.max_hits)
+    timer = PhaseTimer(args.profile)
+    load_references(args.truth, args.gtf, args.tpm, timer)
+    if sweep:
+        # thresholds without a `--sweep_*` option keep their single value
+        evaluate_sweep(args.assembly, args.paf, args.outprefix,
+                       args.sweep_full_prop or [args.full_prop], args.sweep_aln_pid or [args.aln_pid],
+                       args.sweep_aln_len or [args.aln_len], args.sweep_aln_indel or [args.aln_indel],
+                       args.threads, timer)
+    else:
+        summary = evaluate_assembly(args.assembly, args.paf, args.outprefix, args.threads,
+                                    timer, args.progress, args.cprofile, args.checkpoint, args.resume)
+        write_summary(summary, sys.stdout)
+    
+    if args.profile:
+        timer.write_json(args.outprefix + 'timing.json', threads=args.threads)
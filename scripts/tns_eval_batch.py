@@ -0,0 +1,77 @@
+import argparse
+import logging
+import multiprocessing
+import tns_eval
+from fileio import gzopen
+from profiling import PhaseTimer
+
+# Evaluate multiple assemblies against the same truth set, GTF and expression levels.
+# The reference tables are loaded once and shared copy-on-write with the worker processes.
+
+def read_manifest(manifest):
+    rows = list()
+    with gzopen(manifest) as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line) == 0 or line[0] == '#':
+                continue
+            cols = line.split('\t')
+            if len(cols) != 3:
+                raise ValueError('Expected 3 columns (assembly, paf, outprefix) in manifest line: ' + line)
+            rows.append(tuple(cols))
+    return rows
+
+def evaluate_row(row, threads=1, profile=False):
+    assembly, paf, outprefix = row
+    logging.info('evaluating ' + assembly + '...')
+    timer = PhaseTimer(profile)
+    summary = tns_eval.evaluate_assembly(assembly, paf, outprefix, threads, timer)
+    with open(outprefix + 'summary.txt', 'wt') as fw:
+        tns_eval.write_summary(summary, fw)
+    if profile:
+        timer.write_json(outprefix + 'timing.json', threads=threads)
+    return summary
+
+def evaluate_row_profiled(row):
+    return evaluate_row(row, profile=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate the quality of multiple transcriptome assemblies')
+    parser.add_argument('manifest',
+                        help='path of manifest TSV with 3 columns: assembly FASTA file, PAF file, output prefix')
+    parser.add_argument('truth',
+                        help='path of truth transcript IDs or their index built by `id_index.py`')
+    parser.add_argument('gtf',
+                        help='path of GTF')
+    parser.add_argument('output',
+                        help='path of output TSV comparing the summaries of all assemblies')
+    tns_eval.add_parameter_arguments(parser)
+    parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='log the wall time, CPU time, peak memory and throughput of each phase and write them to each output prefix + `timing.json`')
+    args = parser.parse_args()
+
+    tns_eval.init_logging()
+
+    rows = read_manifest(args.manifest)
+    if len(rows) == 0:
+        parser.error('no assemblies in manifest ' + args.manifest)
+
+    tns_eval.set_parameters(args.full_prop, args.aln_pid, args.aln_len, args.aln_indel, args.max_hits)
+    tns_eval.load_references(args.truth, args.gtf, args.tpm, PhaseTimer(args.profile))
+
+    if args.threads > 1 and len(rows) >= args.threads:
+        # evaluate the assemblies concurrently; the worker processes are forked after
+        # the reference tables are loaded
+        func = evaluate_row_profiled if args.profile else evaluate_row
+        with multiprocessing.get_context('fork').Pool(args.threads) as pool:
+            summaries = pool.map(func, rows, chunksize=1)
+    else:
+        # evaluate the assemblies in turn, each with all worker processes
+        summaries = list(evaluate_row(row, args.threads, args.profile) for row in rows)
+
+    with open(args.output, 'wt') as fw:
+        fw.write('outprefix\t' + '\t'.join(name for name, val in summaries[0]) + '\n')
+        for row, summary in zip(rows, summaries):
+            fw.write(row[2] + '\t' + '\t'.join(str(val) for name, val in summary) + '\n')
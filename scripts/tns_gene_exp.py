@@ -1,9 +1,12 @@
 import argparse
+import logging
+from array import array
+from fileio import gzopen
+from gtf_index import load_gtf_index
+from tns_get_tids import get_read_tid_counts
 
-parser = argparse.ArgumentParser(description='Extract gene expression from Trans-NanoSim quantification file')
-parser.add_argument('tpm', help='path of input TPM file')
-parser.add_argument('gtf', help='path of input GTF file')
-args = parser.parse_args()
+# Transcripts and genes are coded by integers; the expression of transcripts is accumulated in arrays
+# indexed by transcript code and summed per gene in order of first appearance of the transcripts.
 
 # function to extract gene ID and transcript ID
 def get_gid_tid_from_attribute_col(col):
@@ -19,37 +22,141 @@ def get_gid_tid_from_attribute_col(col):
             break
     return (gid, tid)
 
-tid_gid_dict = dict()
-
-# parse GTF and extract transcript-gene ID pairings
-with open(args.gtf) as fh:
-    for line in fh:
-        line = line.strip()
-        if len(line.strip()) > 0 and line[0] != '#':
-            cols = line.split('\t')
-            if cols[2] == 'exon' or cols[2] == 'transcript':                
-                gid, tid = get_gid_tid_from_attribute_col(cols[8])
-                if gid and tid:
-                    tid_gid_dict[tid] = gid
-
-gene_counts = dict()
-gene_tpms = dict()
-
-# parse transcript expression file and tally gene expression
-with open(args.tpm) as fh:
-    fh.readline() # read header line
-    for line in fh:
-        tid, count, tpm = line.split('\t')
-        gid = tid_gid_dict[tid]
-        if gid in gene_tpms:
-            gene_tpms[gid] += float(tpm)
-            gene_counts[gid] += float(count)
-        else:
-            gene_tpms[gid] = float(tpm)
-            gene_counts[gid] = float(count)
-
-# print gene expression values
-print('ID', 'count', 'TPM', sep='\t')
-for gid in gene_tpms:
-    print(gid, gene_counts[gid], gene_tpms[gid], sep='\t')
+# get the codes of transcripts, the gene code of each transcript, the gene IDs and,
+# if `with_lengths` is set, the length of each transcript (i.e. the total length of its exons)
+def get_transcript_genes(gtf, with_lengths=False):
+    tx_codes = dict()
+    tx_gene = array('i')
+    gene_names = list()
+    tx_lengths = array('i')
 
+    gtf_idx = load_gtf_index(gtf)
+    if gtf_idx:
+        gene_names = gtf_idx.gene_names
+        for tx, (tid, gene) in enumerate(zip(gtf_idx.tx_names, gtf_idx.tx_gene)):
+            if gene >= 0:
+                tx_codes[tid] = tx
+            tx_gene.append(gene)
+        if with_lengths:
+            tx_lengths = array('i', [0]) * len(tx_gene)
+            for tx, start, end in zip(gtf_idx.exon_tx, gtf_idx.exon_start, gtf_idx.exon_end):
+                tx_lengths[tx] += end - start + 1
+        return tx_codes, tx_gene, gene_names, tx_lengths
+
+    gene_codes = dict()
+    with gzopen(gtf) as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line.strip()) > 0 and line[0] != '#':
+                cols = line.split('\t')
+                if cols[2] == 'exon' or cols[2] == 'transcript':
+                    gid, tid = get_gid_tid_from_attribute_col(cols[8])
+                    if gid and tid:
+                        gene = gene_codes.get(gid)
+                        if gene is None:
+                            gene = len(gene_names)
+                            gene_codes[gid] = gene
+                            gene_names.append(gid)
+                        tx = tx_codes.get(tid)
+                        if tx is None:
+                            tx = len(tx_gene)
+                            tx_codes[tid] = tx
+                            tx_gene.append(gene)
+                            tx_lengths.append(0)
+                        else:
+                            tx_gene[tx] = gene
+                        if cols[2] == 'exon':
+                            tx_lengths[tx] += int(cols[4]) - int(cols[3]) + 1
+    return tx_codes, tx_gene, gene_names, tx_lengths
+
+# code of the transcript of a simulated read; IDs that are not in the GTF file as they are, e.g. with
+# another version, are matched without their versions; None for transcripts not in the GTF file
+def get_read_tx_code(tid, tx_codes, unversioned_tx_codes):
+    tx = tx_codes.get(tid)
+    if tx is None:
+        tx = unversioned_tx_codes.get(tid.split('.')[0])
+    return tx
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract gene expression from Trans-NanoSim quantification file')
+    parser.add_argument('tpm', help='path of input TPM file, or of simulated reads FASTQ file with `--fastq`')
+    parser.add_argument('gtf', help='path of input GTF file')
+    parser.add_argument('--fastq', action='store_true',
+                        help='count the reads of each transcript in the simulated reads FASTQ file instead of reading a TPM file')
+    parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                        help='number of threads for decompressing the input file (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+    tx_codes, tx_gene, gene_names, tx_lengths = get_transcript_genes(args.gtf, args.fastq)
+
+    tx_counts = array('d', [0.0]) * len(tx_gene)
+    tx_tpms = array('d', [0.0]) * len(tx_gene)
+    # transcript codes in order of first appearance
+    txs = list()
+    seen = bytearray(len(tx_gene))
+
+    if args.fastq:
+        # reads per transcript; TPM from the reads per base of the transcripts
+        unversioned_tx_codes = dict((tid.split('.')[0], tx) for tid, tx in tx_codes.items())
+        num_skipped_tids = 0
+        num_skipped_reads = 0
+        for tid, count in get_read_tid_counts(args.tpm, args.threads).items():
+            tx = get_read_tx_code(tid.decode(), tx_codes, unversioned_tx_codes)
+            if tx is None:
+                num_skipped_tids += 1
+                num_skipped_reads += count
+                continue
+            if not seen[tx]:
+                seen[tx] = 1
+                txs.append(tx)
+            tx_counts[tx] += count
+        if num_skipped_tids > 0:
+            logging.warning('skipped ' + str(num_skipped_reads) + ' reads of ' + str(num_skipped_tids) +
+                            ' transcripts that are not in the GTF file')
+        tx_rates = array('d', [0.0]) * len(tx_gene)
+        for tx in txs:
+            if tx_lengths[tx] > 0:
+                tx_rates[tx] = tx_counts[tx] / tx_lengths[tx]
+        total_rate = sum(tx_rates[tx] for tx in txs)
+        if total_rate > 0:
+            for tx in txs:
+                tx_tpms[tx] = tx_rates[tx] / total_rate * 1e6
+    else:
+        # parse transcript expression file
+        with gzopen(args.tpm, threads=args.threads) as fh:
+            fh.readline() # read header line
+            for line in fh:
+                tid, count, tpm = line.split('\t')
+                tx = tx_codes[tid]
+                if not seen[tx]:
+                    seen[tx] = 1
+                    txs.append(tx)
+                tx_counts[tx] += float(count)
+                tx_tpms[tx] += float(tpm)
+
+    # tally gene expression
+    gene_counts = array('d', [0.0]) * len(gene_names)
+    gene_tpms = array('d', [0.0]) * len(gene_names)
+    # gene codes in order of first appearance
+    genes = list()
+    seen = bytearray(len(gene_names))
+    for tx in txs:
+        gene = tx_gene[tx]
+        if not seen[gene]:
+            seen[gene] = 1
+            genes.append(gene)
+        gene_counts[gene] += tx_counts[tx]
+        gene_tpms[gene] += tx_tpms[tx]
+
+    # print gene expression values
+    print('ID', 'count', 'TPM', sep='\t')
+    for gene in genes:
+        count = gene_counts[gene]
+        if args.fastq:
+            count = int(count)
+        print(gene_names[gene], count, gene_tpms[gene], sep='\t')
@@ -0,0 +1,57 @@
+import argparse
+import sys
+from itertools import islice
+from fileio import gzopen
+from id_index import write_id_index
+
+# Written by Ka Ming Nip @kmnip
+
+# Extract the ground truth transcript IDs from a Trans-NanoSim simulated reads FASTQ file in one pass,
+# i.e. the read name up to the first `_`, e.g. `ENST00000000040` of `@ENST00000000040_7_aligned_0_F_0_100_0`.
+# The IDs are deduplicated in memory, so only the unique IDs are sorted.
+
+def get_tid(header):
+    return header[1:].rstrip(b'\r\n').split(b'_', 1)[0]
+
+# count the reads of each transcript (as `bytes`) in order of first appearance
+def get_read_tid_counts(fastq, threads=1):
+    counts = dict()
+    with gzopen(fastq, 'rb', threads=threads) as fh:
+        # the first line of every 4-line record
+        for header in islice(fh, 0, None, 4):
+            tid = get_tid(header)
+            counts[tid] = counts.get(tid, 0) + 1
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract ground truth transcript IDs from a Trans-NanoSim simulated reads FASTQ file')
+    parser.add_argument('fastq', help='path of Trans-NanoSim simulated reads FASTQ file')
+    parser.add_argument('--output', dest='output', metavar='PATH', type=str,
+                        help='path of output transcript IDs (default: stdout)')
+    parser.add_argument('--counts', dest='counts', metavar='PATH', type=str,
+                        help='path of output TSV of the number of reads of each transcript')
+    parser.add_argument('--index', dest='index', metavar='PATH', type=str,
+                        help='path of output index of the transcript IDs (see `id_index.py`)')
+    parser.add_argument('--threads', dest='threads', default='1', metavar='INT', type=int,
+                        help='number of threads for decompressing the FASTQ file (default: %(default)s)')
+    args = parser.parse_args()
+
+    counts = get_read_tid_counts(args.fastq, args.threads)
+    tids = sorted(counts)
+
+    fw = gzopen(args.output, 'wb') if args.output else sys.stdout.buffer
+    if tids:
+        fw.write(b'\n'.join(tids) + b'\n')
+    if args.output:
+        fw.close()
+    else:
+        fw.flush()
+
+    if args.counts:
+        with gzopen(args.counts, 'wt') as fw:
+            fw.write('tid\treads\n')
+            for tid in tids:
+                fw.write(tid.decode() + '\t' + str(counts[tid]) + '\n')
+
+    if args.index:
+        write_id_index(tids, args.index)